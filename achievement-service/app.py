@@ -12,7 +12,10 @@ import json
 from datetime import datetime, timedelta
 
 from shared.database import get_db, create_tables
-from shared.models import Achievement, PlayerAchievement, Player, Score
+from shared.models import Achievement, PlayerAchievement, Player
+from shared.metrics import instrument_app
+from shared.outbox import OutboxConsumer, score_events
+from shared.redis_clients import connect_redis
 
 app = FastAPI(title="Achievement Service")
 
@@ -24,9 +27,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "achievement-service")
+
 # Redis connection with error handling
 try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+    redis_client = connect_redis()
     redis_client.ping()  # Test connection
 except:
     redis_client = None
@@ -36,6 +41,11 @@ except:
 def startup():
     create_tables()
     initialize_default_achievements()
+    score_consumer.start()
+
+@app.on_event("shutdown")
+def shutdown():
+    score_consumer.stop()
 
 def initialize_default_achievements():
     """Create default achievements if they don't exist"""
@@ -130,29 +140,38 @@ def process_achievements(player_id: int):
     db = next(get_db())
     
     try:
-        player = db.query(Player).filter(Player.id == player_id).first()
-        if not player:
-            return
-        
-        # Get all achievements
-        all_achievements = db.query(Achievement).all()
-        
-        # Get player's current achievements
-        current_achievements = set([
-            pa.achievement_id for pa in db.query(PlayerAchievement).filter(
-                PlayerAchievement.player_id == player_id
-            ).all()
-        ])
-        
-        # Calculate player stats
-        total_games = db.query(Score).filter(Score.player_id == player_id).count()
-        best_score = db.query(func.max(Score.score)).filter(Score.player_id == player_id).scalar() or 0
-        total_score = db.query(func.sum(Score.score)).filter(Score.player_id == player_id).scalar() or 0
+        unlock_achievements(db, [player_id])
+        db.commit()
+    except Exception as e:
+        print(f"Error processing achievements: {e}")
+        db.rollback()
+
+def unlock_achievements(db: Session, player_ids: List[int]):
+    """Unlock every achievement the players now qualify for; the caller commits"""
+    players = db.query(Player).filter(Player.id.in_(player_ids)).all()
+    if not players:
+        return
+    
+    # Get all achievements
+    all_achievements = db.query(Achievement).all()
+    
+    # Get the players' current achievements
+    current_achievements = set(
+        db.query(PlayerAchievement.player_id, PlayerAchievement.achievement_id).filter(
+            PlayerAchievement.player_id.in_(player_ids)
+        ).all()
+    )
+    
+    for player in players:
+        # Player totals are kept up to date as scores are inserted
+        total_games = player.total_games or 0
+        best_score = player.best_score or 0
+        total_score = player.total_score or 0
         
         # Check each achievement
         new_achievements = []
         for achievement in all_achievements:
-            if achievement.id in current_achievements:
+            if (player.id, achievement.id) in current_achievements:
                 continue
                 
             unlocked = False
@@ -166,21 +185,26 @@ def process_achievements(player_id: int):
             
             if unlocked:
                 player_achievement = PlayerAchievement(
-                    player_id=player_id,
+                    player_id=player.id,
                     achievement_id=achievement.id,
                     unlocked_at=datetime.utcnow()
                 )
                 db.add(player_achievement)
                 new_achievements.append(achievement.name)
         
-        db.commit()
-        
         if new_achievements:
-            print(f"Player {player_id} unlocked achievements: {new_achievements}")
-            
-    except Exception as e:
-        print(f"Error processing achievements: {e}")
-        db.rollback()
+            print(f"Player {player.id} unlocked achievements: {new_achievements}")
+    
+    db.flush()
+
+def handle_score_events(db: Session, events):
+    """Outbox handler: one achievement check per player in the batch"""
+    player_ids = sorted({event["player_id"] for event in score_events(events)})
+    if player_ids:
+        unlock_achievements(db, player_ids)
+
+# Score submissions reach this service through the outbox, not HTTP calls
+score_consumer = OutboxConsumer("achievements", handle_score_events)
 
 @app.get("/api/achievements/leaderboard")
 def get_achievement_leaderboard(limit: int = 10, db: Session = Depends(get_db)):
@@ -217,7 +241,8 @@ def health():
     return {
         "status": "healthy",
         "service": "achievement-service",
-        "redis": redis_status
+        "redis": redis_status,
+        "outbox": score_consumer.snapshot()
     }
 
 if __name__ == "__main__":
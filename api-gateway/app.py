@@ -4,11 +4,72 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+import asyncio
 import httpx
 import json
+import time
 
-app = FastAPI(title="API Gateway")
+import compression
+from cache import CachedResponse, ResponseCache, cache_key, etag_matches
+from coalesce import SingleFlight
+from models import BatchRequest, BatchResponse, SubRequest, SubResponse
+from ratelimit import AdmissionController, Rejected
+from relay import EventRelay
+from resilience import DEADLINE_HEADER, CircuitBreaker, RetryBudget, request_deadline
+from routes import ALL_METHODS, ROUTES, Route, match_route
+from service_discovery import ServiceDiscovery
+from upstream import UpstreamPool
+from shared.metrics import Counter, Gauge, instrument_app
+
+# Default instance per service; <SERVICE>_URLS adds replicas
+SERVICES = {
+    "players": "http://localhost:8001",
+    "scores": "http://localhost:8002", 
+    "leaderboard": "http://localhost:8003",
+    "achievements": "http://localhost:8004",
+}
+
+# Multi-instance registry with latency-aware balancing and health-based ejection
+discovery = ServiceDiscovery(SERVICES)
+
+# Fail fast while a service is unhealthy, and bound how much we retry it
+breakers = {name: CircuitBreaker(name) for name in SERVICES}
+retry_budgets = {name: RetryBudget() for name in SERVICES}
+
+# Default end-to-end time budget for a proxied request
+GATEWAY_DEADLINE = float(os.getenv("GATEWAY_DEADLINE", "15"))
+MAX_RETRIES = int(os.getenv("GATEWAY_MAX_RETRIES", "2"))
+RETRYABLE_STATUSES = {502, 503, 504}
+
+# Token buckets and concurrency limits for routes with a rate_limit
+admission = AdmissionController()
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0").lower() in ("1", "true", "yes")
+
+# Long-lived pooled clients, one per upstream service
+upstreams = UpstreamPool(SERVICES)
+
+# Gateway-side cache for idempotent GET routes with a cache_ttl
+response_cache = ResponseCache()
+
+# Concurrent identical GETs on cacheable routes share one upstream call
+single_flight = SingleFlight()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstreams.start()
+    health_task = asyncio.create_task(discovery.health_check_services(upstreams.client))
+    # Batch sub-requests are dispatched back through this app in-process
+    app.state.loopback = httpx.AsyncClient(transport=httpx.ASGITransport(app=loopback_app), base_url="http://gateway")
+    yield
+    health_task.cancel()
+    await app.state.loopback.aclose()
+    await leaderboard_events.close()
+    await upstreams.close()
+
+app = FastAPI(title="API Gateway", lifespan=lifespan)
 
 # Enhanced CORS middleware
 app.add_middleware(
@@ -19,303 +80,417 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Service registry
-SERVICES = {
-    "players": "http://localhost:8001",
-    "scores": "http://localhost:8002", 
-    "leaderboard": "http://localhost:8003",
-    "achievements": "http://localhost:8004",
+instrument_app(app, "api-gateway")
+
+# Negotiated gzip/br/zstd for everything the gateway sends, streamed bodies included
+app.add_middleware(compression.CompressionMiddleware)
+
+# Headers that describe a single hop and must not be forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host",
 }
 
-async def proxy_request(service_url: str, path: str, method: str, headers: dict, body: bytes = None, params: dict = None):
-    """Proxy request to microservice with better error handling"""
-    url = f"{service_url}{path}"
-    
-    # Filter out problematic headers
-    clean_headers = {}
-    for key, value in headers.items():
-        if key.lower() not in ['host', 'content-length', 'connection']:
-            clean_headers[key] = value
-    
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-        try:
-            if method == "GET":
-                response = await client.get(url, headers=clean_headers, params=params)
-            elif method == "POST":
-                response = await client.post(url, headers=clean_headers, content=body)
-            elif method == "PUT":
-                response = await client.put(url, headers=clean_headers, content=body)
-            elif method == "DELETE":
-                response = await client.delete(url, headers=clean_headers)
-            else:
-                raise HTTPException(status_code=405, detail="Method not allowed")
-            
-            return response
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+# Set by the gateway's own server on every response
+SERVER_HEADERS = {"date", "server"}
+
+# Request bodies up to this size are buffered so upstream redirects can replay them
+MAX_BUFFERED_BODY = 64 * 1024
 
-def safe_json_response(response):
-    """Safely parse JSON response with fallback handling"""
+def forward_headers(headers, drop=HOP_BY_HOP_HEADERS) -> dict:
+    """Drop hop-by-hop headers before passing headers on"""
+    return {
+        key: value for key, value in headers.items()
+        if key.lower() not in drop
+    }
+
+async def request_content(request: Request):
+    """Small bodies are buffered, everything else is streamed upstream in chunks"""
+    if request.method in ("GET", "DELETE"):
+        return None
+    length = request.headers.get("content-length")
+    if length is not None and int(length) <= MAX_BUFFERED_BODY:
+        return await request.body()
+    return request.stream()
+
+async def stream_upstream(service: str, response: httpx.Response):
+    """Pass the upstream body through unchanged, chunk by chunk"""
     try:
-        # Check if response has content
-        if not response.content or len(response.content) == 0:
-            return JSONResponse(
-                content={"message": "Success", "status": "completed"}, 
-                status_code=response.status_code
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await upstreams.release(service, response)
+
+async def open_upstream(route: Route, request: Request, headers: dict = None) -> httpx.Response:
+    """Send the request to a chosen instance and return the response with its body unread.
+
+    Idempotent GETs, and buffered requests carrying an ``Idempotency-Key``,
+    are retried on another instance for connection errors, timeouts and
+    502/503/504, as long as the service's retry budget and the request
+    deadline allow it.
+    """
+    breaker = breakers[route.service]
+    budget = retry_budgets[route.service]
+    deadline = request_deadline(request.headers, GATEWAY_DEADLINE)
+    headers = dict(headers if headers is not None else forward_headers(request.headers))
+    # Upstream bodies stay identity; the gateway negotiates compression with the client
+    headers.pop("accept-encoding", None)
+    content = await request_content(request)
+    retryable = request.method == "GET" or ("idempotency-key" in request.headers and isinstance(content, bytes))
+    budget.deposit()
+    
+    url_path = request.url.path
+    if request.url.query:
+        url_path = f"{url_path}?{request.url.query}"
+    
+    tried = []
+    while True:
+        if not breaker.allow():
+            raise HTTPException(
+                status_code=503,
+                detail=f"Circuit open for {route.service}",
+                headers={"Retry-After": str(max(1, round(breaker.retry_after())))}
             )
+        instance = discovery.pick(route.service, exclude=tried)
+        if instance is None:
+            breaker.record_failure()
+            raise HTTPException(status_code=503, detail=f"No healthy instances of {route.service}")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            breaker.abandon()
+            raise HTTPException(status_code=504, detail="Request deadline exceeded")
+        tried.append(instance)
         
-        # Try to parse as JSON
-        content = response.json()
-        return JSONResponse(content=content, status_code=response.status_code)
+        # Pass the remaining budget on so the backend can give up in time too
+        headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+        client = upstreams.client(route.service)
+        upstream_request = client.build_request(
+            request.method,
+            f"{instance.url}{url_path}",
+            headers=headers,
+            content=content
+        )
         
-    except (json.JSONDecodeError, ValueError):
-        # If JSON parsing fails, return the text content
+        instance.start()
+        started = time.perf_counter()
         try:
-            text_content = response.text
-            return JSONResponse(
-                content={"message": text_content, "raw_response": True}, 
-                status_code=response.status_code
-            )
-        except:
-            # Ultimate fallback
-            return JSONResponse(
-                content={"message": "Response received", "status_code": response.status_code}, 
-                status_code=response.status_code
+            response = await asyncio.wait_for(
+                upstreams.send(route.service, upstream_request, stream=True, on_release=instance.finish),
+                timeout=remaining
             )
+        except httpx.StreamError as e:
+            breaker.abandon()
+            raise HTTPException(status_code=502, detail=f"Upstream request could not be replayed: {str(e)}")
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            instance.failures += 1
+            error = (504, f"Upstream timed out: {str(e) or 'deadline exceeded'}")
+        except httpx.ConnectError as e:
+            discovery.mark_failed(instance)
+            error = (503, f"Service unavailable: {str(e)}")
+        except httpx.RequestError as e:
+            instance.failures += 1
+            error = (503, f"Service unavailable: {str(e)}")
+        except BaseException:
+            # Cancelled (e.g. by a batch time limit): no outcome to record, but free the probe slot
+            breaker.abandon()
+            raise
+        else:
+            instance.observe(time.perf_counter() - started)
+            if response.status_code < 500:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if (response.status_code in RETRYABLE_STATUSES and retryable
+                    and len(tried) <= MAX_RETRIES and budget.withdraw()):
+                await upstreams.release(route.service, response)
+                continue
+            return response
+        
+        breaker.record_failure()
+        if not (retryable and len(tried) <= MAX_RETRIES and budget.withdraw()):
+            raise HTTPException(status_code=error[0], detail=error[1])
 
-# Player routes - enhanced with safe JSON handling
-@app.get("/api/players")
-async def get_players(request: Request):
-    response = await proxy_request(
-        SERVICES["players"], 
-        "/api/players", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
+async def proxy_request(route: Route, request: Request):
+    """Stream a request to the route's service and its response back"""
+    response = await open_upstream(route, request)
+    return StreamingResponse(
+        stream_upstream(route.service, response),
+        status_code=response.status_code,
+        headers=forward_headers(response.headers, HOP_BY_HOP_HEADERS | SERVER_HEADERS),
+        background=BackgroundTask(upstreams.release, route.service, response)
     )
-    return safe_json_response(response)
 
-@app.post("/api/players")
-async def create_player(request: Request):
-    body = await request.body()
-    print(f"🔄 Gateway: Creating player with body: {body.decode()}")
+def cached_response(entry: CachedResponse, request: Request, cache_status: str):
+    headers = dict(entry.headers)
+    headers.pop("content-length", None)
+    headers["cache-control"] = "no-cache"
+    headers["x-cache"] = cache_status
+    
+    # Serve a compressed variant kept with the entry instead of compressing on every hit
+    encoding = None
+    if compression.compressible(headers.get("content-type")):
+        compression.add_vary(headers)
+        if len(entry.body) >= compression.MIN_SIZE:
+            encoding = compression.negotiate(request.headers.get("accept-encoding"))
+    headers["etag"] = entry.variant_etag(encoding)
     
+    if entry.status_code == 200 and etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        response_cache.not_modified += 1
+        headers.pop("content-type", None)
+        return Response(status_code=304, headers=headers)
+    if encoding is None:
+        return Response(content=entry.body, status_code=entry.status_code, headers=headers)
+    headers["content-encoding"] = encoding
+    return Response(content=entry.variant(encoding), status_code=entry.status_code, headers=headers)
+
+async def fetch_for_cache(route: Route, request: Request) -> CachedResponse:
+    """Fetch and fully buffer an upstream response so it can be cached"""
+    # Conditional headers are answered by the gateway, not the upstream
+    headers = forward_headers(request.headers, HOP_BY_HOP_HEADERS | {"if-none-match", "if-modified-since"})
+    response = await open_upstream(route, request, headers)
     try:
-        response = await proxy_request(
-            SERVICES["players"], 
-            "/api/players", 
-            "POST", 
-            dict(request.headers),
-            body
-        )
-        print(f"📡 Gateway: Received response - Status: {response.status_code}, Content: {response.content}")
-        return safe_json_response(response)
-        
-    except Exception as e:
-        print(f"❌ Gateway error: {e}")
-        raise HTTPException(status_code=500, detail=f"Gateway error: {str(e)}")
-
-@app.get("/api/players/{player_id}")
-async def get_player(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["players"], 
-        f"/api/players/{player_id}", 
-        "GET", 
-        dict(request.headers)
-    )
-    return safe_json_response(response)
-
-@app.put("/api/players/{player_id}")
-async def update_player(player_id: int, request: Request):
-    body = await request.body()
-    response = await proxy_request(
-        SERVICES["players"], 
-        f"/api/players/{player_id}", 
-        "PUT", 
-        dict(request.headers),
-        body
-    )
-    return safe_json_response(response)
-
-@app.delete("/api/players/{player_id}")
-async def delete_player(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["players"], 
-        f"/api/players/{player_id}", 
-        "DELETE", 
-        dict(request.headers)
-    )
-    return safe_json_response(response)
-
-# Score routes
-@app.get("/api/scores")
-async def get_scores(request: Request):
-    response = await proxy_request(
-        SERVICES["scores"], 
-        "/api/scores", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
-    )
-    return safe_json_response(response)
-
-@app.post("/api/scores")
-async def create_score(request: Request):
-    body = await request.body()
-    response = await proxy_request(
-        SERVICES["scores"], 
-        "/api/scores", 
-        "POST", 
-        dict(request.headers),
-        body
-    )
-    return safe_json_response(response)
-
-@app.get("/api/scores/player/{player_id}")
-async def get_player_scores(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["scores"], 
-        f"/api/scores/player/{player_id}", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
-    )
-    return safe_json_response(response)
-
-@app.get("/api/scores/player/{player_id}/stats")
-async def get_player_stats(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["scores"], 
-        f"/api/scores/player/{player_id}/stats", 
-        "GET", 
-        dict(request.headers)
-    )
-    return safe_json_response(response)
-
-# Leaderboard routes
-@app.get("/api/leaderboard/global")
-async def get_global_leaderboard(request: Request):
-    response = await proxy_request(
-        SERVICES["leaderboard"], 
-        "/api/leaderboard/global", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
-    )
-    return safe_json_response(response)
-
-@app.get("/api/leaderboard/gamemode/{game_mode}")
-async def get_gamemode_leaderboard(game_mode: str, request: Request):
-    response = await proxy_request(
-        SERVICES["leaderboard"], 
-        f"/api/leaderboard/gamemode/{game_mode}", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
-    )
-    return safe_json_response(response)
-
-@app.get("/api/leaderboard/recent")
-async def get_recent_scores(request: Request):
-    response = await proxy_request(
-        SERVICES["leaderboard"], 
-        "/api/leaderboard/recent", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
-    )
-    return safe_json_response(response)
-
-@app.get("/api/leaderboard/player/{player_id}/rank")
-async def get_player_rank(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["leaderboard"], 
-        f"/api/leaderboard/player/{player_id}/rank", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
-    )
-    return safe_json_response(response)
-
-# Achievement routes
-@app.get("/api/achievements")
-async def get_achievements(request: Request):
-    response = await proxy_request(
-        SERVICES["achievements"], 
-        "/api/achievements", 
-        "GET", 
-        dict(request.headers)
-    )
-    return safe_json_response(response)
-
-@app.get("/api/achievements/player/{player_id}")
-async def get_player_achievements(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["achievements"], 
-        f"/api/achievements/player/{player_id}", 
-        "GET", 
-        dict(request.headers)
-    )
-    return safe_json_response(response)
-
-@app.post("/api/achievements/check/{player_id}")
-async def check_achievements(player_id: int, request: Request):
-    response = await proxy_request(
-        SERVICES["achievements"], 
-        f"/api/achievements/check/{player_id}", 
-        "POST", 
-        dict(request.headers)
+        body = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+        await upstreams.release(route.service, response)
+    
+    entry = CachedResponse(
+        response.status_code,
+        forward_headers(response.headers, HOP_BY_HOP_HEADERS | SERVER_HEADERS),
+        body,
+        route.cache_ttl
     )
-    return safe_json_response(response)
-
-@app.get("/api/achievements/leaderboard")
-async def get_achievement_leaderboard(request: Request):
-    response = await proxy_request(
-        SERVICES["achievements"], 
-        "/api/achievements/leaderboard", 
-        "GET", 
-        dict(request.headers),
-        params=dict(request.query_params)
+    if response.status_code == 200 and "no-store" not in response.headers.get("cache-control", ""):
+        response_cache.put(cache_key(request.url.path, request.query_params.multi_items()), entry)
+    return entry
+
+async def cached_proxy_request(route: Route, request: Request):
+    """Serve GETs for cacheable routes from the gateway cache when fresh"""
+    key = cache_key(request.url.path, request.query_params.multi_items())
+    entry = response_cache.get(key)
+    if entry is not None:
+        return cached_response(entry, request, "HIT")
+    entry, shared = await single_flight.do(key, lambda: fetch_for_cache(route, request))
+    return cached_response(entry, request, "COALESCED" if shared else "MISS")
+
+# Limits for the multiplexed batch endpoint
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", "10"))
+
+# Caller headers that sub-requests inherit
+BATCH_INHERITED_HEADERS = ("authorization", "x-api-key", "accept-language")
+# Carries the batch caller's rate-limit key to its sub-requests; only read on the loopback transport
+LOOPBACK_CLIENT_HEADER = b"x-gateway-client-key"
+
+async def loopback_app(scope, receive, send):
+    """Entry point for batch sub-requests: moves the caller's key from its header into the scope"""
+    headers = []
+    scope = dict(scope)
+    for name, value in scope["headers"]:
+        if name == LOOPBACK_CLIENT_HEADER:
+            scope["client_key"] = value.decode("latin-1")
+        else:
+            headers.append((name, value))
+    scope["headers"] = headers
+    await app(scope, receive, send)
+
+async def run_sub_request(sub: SubRequest, headers: dict) -> SubResponse:
+    response = await app.state.loopback.request(
+        sub.method.upper(),
+        sub.path,
+        params=sub.params or None,
+        json=sub.body,
+        headers=headers
     )
-    return safe_json_response(response)
+    if not response.content:
+        body = None
+    elif "json" in response.headers.get("content-type", ""):
+        body = json.loads(response.content)
+    else:
+        body = response.text
+    return SubResponse(id=sub.id, status=response.status_code, body=body)
 
-@app.get("/health")
-async def health_check():
-    """Check health of all services"""
-    service_health = {}
+@app.post("/api/batch", response_model=BatchResponse)
+async def batch(batch_request: BatchRequest, request: Request):
+    """Run several sub-requests concurrently and return all results in one response"""
+    if len(batch_request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_REQUESTS} sub-requests per batch")
+    for sub in batch_request.requests:
+        route = match_route(sub.path)
+        if route is None or sub.method.upper() not in route.methods:
+            raise HTTPException(status_code=400, detail=f"Sub-request not routable: {sub.method} {sub.path}")
     
-    for service_name, service_url in SERVICES.items():
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{service_url}/health")
-                service_health[service_name] = {
-                    "status": "healthy" if response.status_code == 200 else "unhealthy",
-                    "response_time": response.elapsed.total_seconds()
-                }
-        except Exception as e:
-            service_health[service_name] = {
-                "status": "unhealthy",
-                "error": str(e)
-            }
+    timeout = min(batch_request.timeout or BATCH_TIMEOUT, BATCH_TIMEOUT)
+    headers = {
+        key: value for key, value in request.headers.items()
+        if key.lower() in BATCH_INHERITED_HEADERS
+    }
+    # Sub-requests count against this caller, however they are addressed
+    headers[LOOPBACK_CLIENT_HEADER.decode()] = client_key(request)
+    # Sub-responses are decoded in-process; only the combined response is compressed
+    headers["accept-encoding"] = "identity"
+    
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(run_sub_request(sub, headers)) for sub in batch_request.requests]
+    done, pending = await asyncio.wait(tasks, timeout=timeout) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
     
-    # Determine overall health
-    overall_status = "healthy" if all(
-        service["status"] == "healthy" for service in service_health.values()
-    ) else "degraded"
+    results = []
+    for sub, task in zip(batch_request.requests, tasks):
+        if task in pending:
+            results.append(SubResponse(id=sub.id, status=504, error="Batch time limit exceeded"))
+        elif task.exception() is not None:
+            results.append(SubResponse(id=sub.id, status=502, error=str(task.exception())))
+        else:
+            results.append(task.result())
     
+    return BatchResponse(results=results, elapsed_ms=round((time.perf_counter() - started) * 1000, 3))
+
+def client_key(request: Request) -> str:
+    """API key if the caller sent one, otherwise its address"""
+    batch_caller = request.scope.get("client_key")
+    if batch_caller:
+        return batch_caller
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return f"key:{api_key}"
+    host = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUST_FORWARDED_FOR:
+        host = forwarded.split(",")[0].strip()
+    return f"ip:{host}"
+
+async def admitted_proxy_request(route: Route, request: Request):
+    """Apply the route's admission policy, holding a slot until upstream responds"""
+    try:
+        limiter = await admission.admit(route.prefix, client_key(request), route.rate_limit)
+    except Rejected as e:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"Too many requests ({e.reason})"},
+            headers={"Retry-After": e.retry_after_header}
+        )
+    try:
+        return await proxy_request(route, request)
+    finally:
+        limiter.release()
+
+async def open_leaderboard_stream() -> httpx.Response:
+    # Long-lived, so it bypasses the pool's slot accounting and the deadline
+    instance = discovery.pick("leaderboard")
+    if instance is None:
+        raise httpx.ConnectError("No healthy instances of leaderboard")
+    client = upstreams.client("leaderboard")
+    request = client.build_request(
+        "GET", f"{instance.url}/api/leaderboard/stream",
+        headers={"accept": "text/event-stream"},
+        timeout=httpx.Timeout(connect=2.0, read=None, write=5.0, pool=5.0)
+    )
+    response = await client.send(request, stream=True)
+    if response.status_code != 200:
+        await response.aclose()
+        raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=request, response=response)
+    return response
+
+# Every browser on the live leaderboard shares one upstream subscription
+leaderboard_events = EventRelay("leaderboard", open_leaderboard_stream)
+
+@app.get("/api/leaderboard/stream")
+async def leaderboard_stream():
+    """Live leaderboard deltas and new scores as Server-Sent Events"""
+    return StreamingResponse(
+        leaderboard_events.subscribe(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.api_route("/api/{path:path}", methods=list(ALL_METHODS))
+async def gateway(path: str, request: Request):
+    route = match_route(request.url.path)
+    if route is None:
+        raise HTTPException(status_code=404, detail="No route for path")
+    request.scope["metrics_route"] = route.prefix
+    if request.method not in route.methods:
+        raise HTTPException(status_code=405, detail="Method not allowed")
+    if route.rate_limit and request.method in route.rate_limit.methods:
+        return await admitted_proxy_request(route, request)
+    if request.method == "GET" and route.cache_ttl:
+        return await cached_proxy_request(route, request)
+    return await proxy_request(route, request)
+
+# Gateway internals exported on /metrics, read from the same state as /stats
+def _per_upstream(snapshot: dict, field: str):
+    return [({"upstream": name}, values.get(field, 0)) for name, values in snapshot.items()]
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+Gauge("gateway_upstream_pool_in_use", "Upstream requests holding a pooled connection", ["upstream"],
+      collect=lambda: _per_upstream(upstreams.snapshot(), "in_use"))
+Gauge("gateway_upstream_pool_idle", "Idle keep-alive connections per upstream", ["upstream"],
+      collect=lambda: _per_upstream(upstreams.snapshot(), "idle"))
+Counter("gateway_upstream_pool_wait_seconds_total", "Time spent waiting for a pooled connection", ["upstream"],
+        collect=lambda: [({"upstream": name}, stats.wait_total) for name, stats in upstreams.stats.items()])
+Counter("gateway_cache_requests_total", "Gateway response cache lookups", ["result"],
+        collect=lambda: [({"result": "hit"}, response_cache.hits), ({"result": "miss"}, response_cache.misses),
+                         ({"result": "not_modified"}, response_cache.not_modified)])
+Counter("gateway_coalesced_requests_total", "GETs served by another request's upstream call",
+        collect=lambda: [({}, single_flight.coalesced)])
+Gauge("gateway_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["upstream"],
+      collect=lambda: [({"upstream": name}, BREAKER_STATES[b.state]) for name, b in breakers.items()])
+Counter("gateway_retries_total", "Upstream retries spent from the retry budget", ["upstream"],
+        collect=lambda: [({"upstream": name}, b.retries) for name, b in retry_budgets.items()])
+Counter("gateway_admission_rejected_total", "Requests rejected by admission control", ["route", "reason"],
+        collect=lambda: [({"route": prefix, "reason": reason}, count)
+                         for prefix, reasons in admission.rejected.items() for reason, count in reasons.items()])
+Counter("gateway_compressed_bytes_total", "Response bytes before and after compression", ["encoding", "stage"],
+        collect=lambda: [({"encoding": name, "stage": "in"}, count) for name, count in compression.stats.bytes_in.items()]
+                      + [({"encoding": name, "stage": "out"}, count) for name, count in compression.stats.bytes_out.items()])
+Gauge("gateway_stream_clients", "Clients connected to a relayed event stream", ["stream"],
+      collect=lambda: [({"stream": "leaderboard"}, len(leaderboard_events.clients))])
+
+@app.get("/health")
+def health_check():
+    """Aggregate health of all services, served from the background snapshot"""
+    snapshot = discovery.health_snapshot
+    checked_at = snapshot["checked_at"]
+    return {
+        "status": snapshot["status"],
+        "services": snapshot["services"],
+        "gateway": "healthy",
+        "checked_at": checked_at,
+        "age_seconds": round(time.time() - checked_at, 3) if checked_at else None
+    }
+
+@app.get("/livez")
+def liveness():
+    """Cheap liveness probe - no fan-out to backends"""
+    return {"status": "alive"}
+
+@app.get("/stats")
+def get_stats():
+    """Gateway internals: pools, cache, coalescing, breakers, retries and admission"""
     return {
-        "status": overall_status,
-        "services": service_health,
-        "gateway": "healthy"
+        "pool": upstreams.snapshot(),
+        "cache": response_cache.snapshot(),
+        "coalescing": single_flight.snapshot(),
+        "breakers": {name: breaker.snapshot() for name, breaker in breakers.items()},
+        "retry_budgets": {name: budget.snapshot() for name, budget in retry_budgets.items()},
+        "admission": admission.snapshot(),
+        "streams": {"leaderboard": leaderboard_events.snapshot()},
+        "compression": compression.stats.snapshot()
     }
 
 @app.get("/services")
 def get_services():
     """Get available services"""
     return {
-        "services": SERVICES,
+        "services": discovery.snapshot(),
+        "routes": [
+            {"prefix": route.prefix, "service": route.service, "methods": list(route.methods)}
+            for route in ROUTES
+        ],
         "version": "1.0.0",
-        "features": ["achievements", "redis_caching", "real_time_stats"]
+        "features": ["achievements", "redis_caching", "real_time_stats", "live_leaderboard_stream"]
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import compression
+
+
+def make_etag(body: bytes) -> str:
+    """Strong validator derived from the exact response bytes"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison function (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def cache_key(path: str, query_items) -> Tuple:
+    """Same path plus the same query parameters in any order share an entry"""
+    return (path, tuple(sorted(query_items)))
+
+
+class CachedResponse:
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes, ttl: float):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = make_etag(body)
+        self.expires_at = time.monotonic() + ttl
+        # Compressed bodies per content-coding, built on first request
+        self.variants: Dict[str, bytes] = {}
+
+    def variant_etag(self, encoding: Optional[str]) -> str:
+        """Each content-coding is a distinct representation with its own validator"""
+        if encoding is None:
+            return self.etag
+        return self.etag[:-1] + f'-{encoding}"'
+
+    def variant(self, encoding: str) -> bytes:
+        body = self.variants.get(encoding)
+        if body is None:
+            body = self.variants[encoding] = compression.compress(encoding, self.body)
+        return body
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class ResponseCache:
+    """In-process LRU cache of upstream GET responses with per-entry TTLs"""
+
+    def __init__(self, max_entries: int = None, max_body_size: int = None):
+        self.max_entries = max_entries or int(os.getenv("GATEWAY_CACHE_ENTRIES", "1024"))
+        self.max_body_size = max_body_size or int(os.getenv("GATEWAY_CACHE_MAX_BODY", str(1024 * 1024)))
+        self.entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Tuple) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None or not entry.fresh:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Tuple, entry: CachedResponse) -> bool:
+        if len(entry.body) > self.max_body_size:
+            return False
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return True
+
+    def snapshot(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "compressed_variants": sum(len(entry.variants) for entry in self.entries.values()),
+        }
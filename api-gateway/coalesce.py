@@ -0,0 +1,40 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running wait for the same result. The task is shielded,
+    so a disconnecting caller does not cancel the fetch for everyone else.
+    """
+
+    def __init__(self):
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Run ``fn`` once per key; returns ``(result, shared)``"""
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self.inflight[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+    def snapshot(self) -> Dict:
+        return {
+            "inflight": len(self.inflight),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+        }
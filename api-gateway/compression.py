@@ -0,0 +1,242 @@
+import os
+import zlib
+from typing import Dict, List, Optional
+
+ENABLED = os.getenv("GATEWAY_COMPRESSION", "1").lower() in ("1", "true", "yes", "on")
+# Responses smaller than this are sent uncompressed
+MIN_SIZE = int(os.getenv("GATEWAY_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GATEWAY_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("GATEWAY_BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("GATEWAY_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+# Compressors buffer output, which would hold back live events
+NEVER_COMPRESS_TYPES = ("text/event-stream",)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipEncoder:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+# Server preference when the client accepts several encodings equally
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+PREFERENCE = [name for name in ("zstd", "br", "gzip") if name in ENCODERS]
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the encoding for a response from the request's ``Accept-Encoding``"""
+    if not accept_encoding or not ENABLED:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if name:
+            weights[name] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for name in PREFERENCE:
+        weight = weights.get(name, wildcard)
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    content_type = (content_type or "").lower()
+    if content_type.startswith(NEVER_COMPRESS_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(headers: Dict[str, str]):
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers["vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+
+
+class CompressionStats:
+    def __init__(self):
+        self.responses: Dict[str, int] = {}
+        self.bytes_in: Dict[str, int] = {}
+        self.bytes_out: Dict[str, int] = {}
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int):
+        self.responses[encoding] = self.responses.get(encoding, 0) + 1
+        self.bytes_in[encoding] = self.bytes_in.get(encoding, 0) + bytes_in
+        self.bytes_out[encoding] = self.bytes_out.get(encoding, 0) + bytes_out
+
+    def snapshot(self) -> Dict:
+        return {
+            "min_size": MIN_SIZE,
+            "encodings": PREFERENCE,
+            "responses": dict(self.responses),
+            "ratio": {
+                name: round(self.bytes_out[name] / self.bytes_in[name], 3)
+                for name in self.bytes_in if self.bytes_in[name]
+            },
+        }
+
+
+stats = CompressionStats()
+
+
+def compress(encoding: str, body: bytes) -> bytes:
+    """Compress a complete body in one go"""
+    encoder = ENCODERS[encoding]()
+    compressed = encoder.compress(body) + encoder.finish()
+    stats.record(encoding, len(body), len(compressed))
+    return compressed
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing response bodies as they stream out.
+
+    Responses that already carry ``Content-Encoding`` (such as pre-compressed
+    cache variants) pass through untouched, as do event streams and bodies
+    shorter than ``GATEWAY_COMPRESS_MIN_SIZE``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = None
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self.app, encoding, send)(scope, receive)
+
+
+class _CompressedResponder:
+    def __init__(self, app, encoding: str, send):
+        self.app = app
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[dict] = None
+        self.encoder = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def __call__(self, scope, receive):
+        await self.app(scope, receive, self.send_wrapper)
+
+    def _headers(self) -> List:
+        return self.start["headers"]
+
+    def _get(self, name: bytes) -> Optional[str]:
+        for key, value in self._headers():
+            if key.lower() == name:
+                return value.decode("latin-1")
+        return None
+
+    async def send_wrapper(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.start["headers"] = list(message.get("headers", []))
+            status = message["status"]
+            content_type = self._get(b"content-type")
+            length = self._get(b"content-length")
+            if compressible(content_type):
+                self._vary()
+            if (status < 200 or status in (204, 304) or self._get(b"content-encoding")
+                    or not compressible(content_type)
+                    or (length is not None and int(length) < MIN_SIZE)):
+                self.passthrough = True
+                await self.send(self.start)
+            # Otherwise hold the start until the first body chunk decides
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body and len(body) < MIN_SIZE:
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.encoder = ENCODERS[self.encoding]()
+            headers = [(k, v) for k, v in self._headers() if k.lower() != b"content-length"]
+            headers.append((b"content-encoding", self.encoding.encode()))
+            self.start["headers"] = headers
+            await self.send(self.start)
+
+        self.bytes_in += len(body)
+        chunk = self.encoder.compress(body) if body else b""
+        if not more_body:
+            chunk += self.encoder.finish()
+        self.bytes_out += len(chunk)
+        if not more_body:
+            stats.record(self.encoding, self.bytes_in, self.bytes_out)
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _vary(self):
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in self._headers()}
+        if "accept-encoding" in headers.get("vary", "").lower():
+            return
+        self.start["headers"] = [(k, v) for k, v in self._headers() if k.lower() != b"vary"]
+        vary = headers.get("vary")
+        self.start["headers"].append((b"vary", (f"{vary}, Accept-Encoding" if vary else "Accept-Encoding").encode()))
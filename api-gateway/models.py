@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+    timeout: Optional[float] = None
+
+class SubResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    body: Optional[Any] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[SubResponse]
+    elapsed_ms: float
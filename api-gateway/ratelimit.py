@@ -0,0 +1,146 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> Tuple[bool, float]:
+        """Take one token; returns ``(allowed, seconds until a token is available)``"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+class ConcurrencyLimiter:
+    """At most ``limit`` requests in flight with at most ``max_queue`` waiting"""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.slots = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if not self.slots.locked():
+            await self.slots.acquire()
+        elif self.waiting >= self.max_queue:
+            return False
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self.slots.release()
+
+class RateLimit:
+    """Admission policy for one route.
+
+    ``rate``/``burst`` is a token bucket shared by all clients of the route,
+    ``client_rate``/``client_burst`` a bucket per client key, and
+    ``concurrency``/``queue`` bound how many requests are in flight upstream
+    and how many may wait for a slot (for at most ``queue_timeout`` seconds).
+    Only requests whose method is in ``methods`` are limited.
+    """
+
+    def __init__(self, rate: float, burst: float, client_rate: float, client_burst: float,
+                 concurrency: int, queue: int = 0, queue_timeout: float = 2.0, methods=("POST", "PUT", "DELETE")):
+        self.rate = rate
+        self.burst = burst
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.methods = tuple(methods)
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+class AdmissionController:
+    """Token buckets and concurrency limits keyed by route prefix and client"""
+
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        self.route_buckets: Dict[str, TokenBucket] = {}
+        self.client_buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+        self.admitted: Dict[str, int] = {}
+        self.rejected: Dict[str, Dict[str, int]] = {}
+
+    def _client_bucket(self, prefix: str, client: str, policy: RateLimit) -> TokenBucket:
+        key = (prefix, client)
+        bucket = self.client_buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(policy.client_rate, policy.client_burst)
+            self.client_buckets[key] = bucket
+            while len(self.client_buckets) > self.max_clients:
+                self.client_buckets.popitem(last=False)
+        else:
+            self.client_buckets.move_to_end(key)
+        return bucket
+
+    def _reject(self, prefix: str, reason: str, retry_after: float):
+        counts = self.rejected.setdefault(prefix, {})
+        counts[reason] = counts.get(reason, 0) + 1
+        raise Rejected(reason, retry_after)
+
+    async def admit(self, prefix: str, client: str, policy: RateLimit) -> ConcurrencyLimiter:
+        """Admit a request or raise :class:`Rejected`; returns the limiter to release"""
+        allowed, wait = self._client_bucket(prefix, client, policy).take()
+        if not allowed:
+            self._reject(prefix, "client_rate", wait)
+
+        route_bucket = self.route_buckets.get(prefix)
+        if route_bucket is None:
+            route_bucket = self.route_buckets[prefix] = TokenBucket(policy.rate, policy.burst)
+        allowed, wait = route_bucket.take()
+        if not allowed:
+            self._reject(prefix, "route_rate", wait)
+
+        limiter = self.limiters.get(prefix)
+        if limiter is None:
+            limiter = self.limiters[prefix] = ConcurrencyLimiter(policy.concurrency, policy.queue)
+        if not await limiter.acquire(policy.queue_timeout):
+            self._reject(prefix, "concurrency", 1.0)
+
+        self.admitted[prefix] = self.admitted.get(prefix, 0) + 1
+        return limiter
+
+    def snapshot(self) -> Dict:
+        prefixes = set(self.limiters) | set(self.admitted) | set(self.rejected)
+        result = {}
+        for prefix in prefixes:
+            limiter = self.limiters.get(prefix)
+            result[prefix] = {
+                "admitted": self.admitted.get(prefix, 0),
+                "rejected": self.rejected.get(prefix, {}),
+                "in_flight": limiter.active if limiter else 0,
+                "queued": limiter.waiting if limiter else 0,
+            }
+        return result
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class EventRelay:
+    """Shares one upstream Server-Sent Events subscription between many clients.
+
+    The upstream stream is opened when the first client connects and closed
+    when the last one leaves. Events are forwarded frame by frame into small
+    bounded per-client queues; a client that falls ``max_queue`` events behind
+    is disconnected (``EventSource`` reconnects on its own). Idle clients get a
+    keep-alive comment every ``heartbeat`` seconds.
+    """
+
+    def __init__(self, name: str, open_stream: Callable[[], httpx.Response], heartbeat: float = 15.0,
+                 max_queue: int = 100, reconnect_delay: float = 2.0):
+        self.name = name
+        self.open_stream = open_stream
+        self.heartbeat = heartbeat
+        self.max_queue = max_queue
+        self.reconnect_delay = reconnect_delay
+        self.clients: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.events = 0
+        self.dropped = 0
+        self.upstream_connects = 0
+
+    async def pump(self):
+        while self.clients:
+            try:
+                response = await self.open_stream()
+                self.upstream_connects += 1
+                try:
+                    buffer = b""
+                    async for chunk in response.aiter_raw():
+                        buffer += chunk.replace(b"\r\n", b"\n")
+                        while b"\n\n" in buffer:
+                            frame, buffer = buffer.split(b"\n\n", 1)
+                            # Upstream comments and retry hints are per-hop
+                            if frame.startswith(b":") or frame.startswith(b"retry:"):
+                                continue
+                            self.publish(frame + b"\n\n")
+                        if not self.clients:
+                            return
+                finally:
+                    await response.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event stream from {self.name} failed: {e}")
+            await asyncio.sleep(self.reconnect_delay)
+
+    def publish(self, frame: bytes):
+        self.events += 1
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self.clients.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.dropped += 1
+
+    def _task_done(self, task: asyncio.Task):
+        if self.task is task:
+            self.task = None
+
+    async def subscribe(self):
+        """Async generator of SSE frames for one downstream client"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self.clients.add(queue)
+        if self.task is None:
+            self.task = asyncio.create_task(self.pump())
+            self.task.add_done_callback(self._task_done)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.clients.discard(queue)
+            if not self.clients and self.task is not None:
+                self.task.cancel()
+                self.task = None
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "clients": len(self.clients),
+            "upstream_connected": self.task is not None,
+            "upstream_connects": self.upstream_connects,
+            "events": self.events,
+            "dropped_clients": self.dropped,
+        }
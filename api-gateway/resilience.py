@@ -0,0 +1,144 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import logging
+from typing import Dict, Optional
+
+from shared.deadline import DEADLINE_HEADER
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Per-upstream breaker: fail fast while a service keeps failing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens for
+    ``open_seconds``; it then lets ``half_open_probes`` requests through and
+    closes again on success or re-opens on failure. Probes that report
+    nothing for another ``open_seconds`` re-open it too, so a lost probe
+    cannot hold it half-open.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, open_seconds: float = None,
+                 half_open_probes: int = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("CB_FAILURE_THRESHOLD", "5"))
+        self.open_seconds = open_seconds or float(os.getenv("CB_OPEN_SECONDS", "10"))
+        self.half_open_probes = half_open_probes or int(os.getenv("CB_HALF_OPEN_PROBES", "1"))
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_opened_at = 0.0
+        self.probes_in_flight = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.half_opened_at = time.monotonic()
+            self.probes_in_flight = 0
+            logger.info(f"Circuit for {self.name} half-open, probing")
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                if time.monotonic() - self.half_opened_at >= self.open_seconds:
+                    logger.warning(f"Circuit for {self.name} probes never reported, re-opening")
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+                    self.probes_in_flight = 0
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = CLOSED
+        self.failures = 0
+        self.probes_in_flight = 0
+
+    def abandon(self):
+        """An admitted request ended without telling us anything about the upstream"""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.probes_in_flight = 0
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": round(self.retry_after(), 3) if self.state == OPEN else 0,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
+
+class RetryBudget:
+    """Caps retries to a fraction of recent traffic.
+
+    Every request deposits ``ratio`` tokens and every retry withdraws one,
+    with a floor of ``min_per_second`` retries so idle services can still
+    retry; the balance never exceeds ``max_tokens``.
+    """
+
+    def __init__(self, ratio: float = None, min_per_second: float = None, max_tokens: float = None):
+        self.ratio = ratio if ratio is not None else float(os.getenv("RETRY_BUDGET_RATIO", "0.1"))
+        self.min_per_second = min_per_second if min_per_second is not None else float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+        self.max_tokens = max_tokens or float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "20"))
+        self.tokens = self.max_tokens
+        self.updated = time.monotonic()
+        self.retries = 0
+        self.denied = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.retries += 1
+        return True
+
+    def snapshot(self) -> Dict:
+        self._refill()
+        return {"tokens": round(self.tokens, 2), "retries": self.retries, "denied": self.denied}
+
+def request_deadline(headers, default_seconds: float) -> float:
+    """Absolute monotonic deadline: the caller's budget, capped by the gateway default"""
+    budget = default_seconds
+    value: Optional[str] = headers.get(DEADLINE_HEADER)
+    if value:
+        try:
+            budget = min(budget, max(0.0, float(value) / 1000))
+        except ValueError:
+            pass
+    return time.monotonic() + budget
@@ -0,0 +1,53 @@
+import os
+from typing import List, Optional
+
+from ratelimit import RateLimit
+
+ALL_METHODS = ("GET", "POST", "PUT", "DELETE")
+
+
+class Route:
+    """Maps a path prefix on the gateway to an upstream service.
+
+    ``cache_ttl`` (seconds) enables the gateway response cache for GETs and
+    ``rate_limit`` puts admission control in front of the route.
+    """
+
+    def __init__(self, prefix: str, service: str, methods=ALL_METHODS, cache_ttl: float = 0,
+                 rate_limit: Optional[RateLimit] = None):
+        self.prefix = prefix.rstrip("/")
+        self.service = service
+        self.methods = tuple(methods)
+        self.cache_ttl = cache_ttl
+        self.rate_limit = rate_limit
+
+    def matches(self, path: str) -> bool:
+        return path == self.prefix or path.startswith(self.prefix + "/")
+
+
+# Score submissions all land on the single SQLite writer
+SCORE_WRITES = RateLimit(
+    rate=float(os.getenv("SCORE_WRITE_RATE", "200")),
+    burst=float(os.getenv("SCORE_WRITE_BURST", "400")),
+    client_rate=float(os.getenv("SCORE_WRITE_CLIENT_RATE", "20")),
+    client_burst=float(os.getenv("SCORE_WRITE_CLIENT_BURST", "40")),
+    concurrency=int(os.getenv("SCORE_WRITE_CONCURRENCY", "4")),
+    queue=int(os.getenv("SCORE_WRITE_QUEUE", "32")),
+)
+
+
+# Declarative route table - the longest matching prefix wins
+ROUTES: List[Route] = [
+    Route("/api/players", "players"),
+    Route("/api/scores", "scores", methods=("GET", "POST"), rate_limit=SCORE_WRITES),
+    Route("/api/leaderboard", "leaderboard", methods=("GET",), cache_ttl=5),
+    Route("/api/leaderboard/recent", "leaderboard", methods=("GET",), cache_ttl=2),
+    Route("/api/achievements", "achievements", methods=("GET", "POST"), cache_ttl=10),
+]
+
+
+def match_route(path: str) -> Optional[Route]:
+    candidates = [route for route in ROUTES if route.matches(path)]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda route: len(route.prefix))
@@ -1,57 +1,184 @@
-import aiohttp
 import asyncio
-from typing import Dict, Optional
+import os
 import random
+import time
+from typing import Dict, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
-class ServiceDiscovery:
-    def __init__(self):
-        self.services = {
-            "player-service": [
-                {"host": "localhost", "port": 8001, "healthy": True},
-            ],
-            "score-service": [
-                {"host": "localhost", "port": 8002, "healthy": True},
-            ],
-            "leaderboard-service": [
-                {"host": "localhost", "port": 8003, "healthy": True},
-            ]
+# Weight of the newest latency sample in the moving average
+EWMA_ALPHA = 0.3
+
+class Instance:
+    """One replica of a service together with its load-balancing state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.ewma_latency = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.last_health_check = None
+        self.last_response_time = None
+        self.last_error = None
+
+    def start(self):
+        self.outstanding += 1
+        self.requests += 1
+
+    def finish(self):
+        self.outstanding -= 1
+
+    def observe(self, latency: float):
+        if self.ewma_latency == 0.0:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+
+    def cost(self) -> float:
+        # Expected wait if we add one more request to this instance
+        return (self.ewma_latency or 0.001) * (self.outstanding + 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_health_check": self.last_health_check,
         }
-    
-    def get_service_url(self, service_name: str) -> Optional[str]:
-        if service_name not in self.services:
-            return None
-        
-        # Get healthy instances
+
+class ServiceDiscovery:
+    """Multi-instance registry with latency-aware load balancing.
+
+    Instances come from ``<SERVICE>_URLS`` (comma separated, e.g.
+    ``SCORES_URLS=http://localhost:8002,http://localhost:8012``) and fall
+    back to the single default URL. ``GATEWAY_BALANCER`` selects
+    ``ewma`` (power of two choices on EWMA latency x outstanding, default)
+    or ``least_outstanding``.
+    """
+
+    def __init__(self, default_urls: Dict[str, str]):
+        self.services: Dict[str, List[Instance]] = {}
+        for name, url in default_urls.items():
+            urls = os.getenv(f"{name.upper()}_URLS", url)
+            self.services[name] = [Instance(u.strip()) for u in urls.split(",") if u.strip()]
+        self.strategy = os.getenv("GATEWAY_BALANCER", "ewma")
+        self.health_check_interval = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+        self.health_check_timeout = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+        self.health_snapshot: Dict = {"status": "unknown", "services": {}, "checked_at": None}
+
+    def instances(self, service_name: str) -> List[Instance]:
+        return self.services.get(service_name, [])
+
+    def pick(self, service_name: str, exclude=()) -> Optional[Instance]:
+        # Get healthy instances, preferring ones not already tried for this request
         healthy_instances = [
-            instance for instance in self.services[service_name] 
-            if instance["healthy"]
+            instance for instance in self.instances(service_name)
+            if instance.healthy
         ]
-        
+        untried = [instance for instance in healthy_instances if instance not in exclude]
+        if untried:
+            healthy_instances = untried
+
         if not healthy_instances:
             logger.warning(f"No healthy instances for {service_name}")
             return None
-        
-        # Simple round-robin (or random selection)
-        instance = random.choice(healthy_instances)
-        return f"http://{instance['host']}:{instance['port']}"
-    
-    async def health_check_services(self):
+        if len(healthy_instances) == 1:
+            return healthy_instances[0]
+
+        if self.strategy == "least_outstanding":
+            fewest = min(instance.outstanding for instance in healthy_instances)
+            return random.choice([i for i in healthy_instances if i.outstanding == fewest])
+
+        first, second = random.sample(healthy_instances, 2)
+        return first if first.cost() <= second.cost() else second
+
+    def get_service_url(self, service_name: str) -> Optional[str]:
+        instance = self.pick(service_name)
+        return instance.url if instance else None
+
+    def mark_failed(self, instance: Instance):
+        """Eject an instance after a connection failure until it passes a health check"""
+        instance.failures += 1
+        if instance.healthy:
+            logger.warning(f"Ejecting {instance.url} after connection failure")
+        instance.healthy = False
+
+    async def check_instance(self, client, instance: Instance) -> bool:
+        started = time.perf_counter()
+        try:
+            response = await client.get(f"{instance.url}/health", timeout=self.health_check_timeout)
+            healthy = response.status_code == 200
+            instance.last_error = None if healthy else f"HTTP {response.status_code}"
+        except Exception as e:
+            logger.warning(f"Health check failed for {instance.url}: {e}")
+            healthy = False
+            instance.last_error = str(e) or type(e).__name__
+        elapsed = time.perf_counter() - started
+        if healthy:
+            instance.observe(elapsed)
+        instance.healthy = healthy
+        instance.last_response_time = round(elapsed, 4)
+        instance.last_health_check = time.time()
+        return healthy
+
+    async def refresh_health(self, client_for) -> Dict:
+        """Check every instance of every service concurrently and cache the result"""
+        checks = [
+            self.check_instance(client_for(service_name), instance)
+            for service_name, instances in self.services.items()
+            for instance in instances
+        ]
+        await asyncio.gather(*checks)
+
+        services = {}
+        for service_name, instances in self.services.items():
+            healthy = [instance for instance in instances if instance.healthy]
+            if len(healthy) == len(instances):
+                status = "healthy"
+            elif healthy:
+                status = "degraded"
+            else:
+                status = "unhealthy"
+            services[service_name] = {
+                "status": status,
+                "healthy_instances": len(healthy),
+                "instances": [
+                    {
+                        "url": instance.url,
+                        "status": "healthy" if instance.healthy else "unhealthy",
+                        "response_time": instance.last_response_time,
+                        "error": instance.last_error,
+                    }
+                    for instance in instances
+                ],
+            }
+
+        self.health_snapshot = {
+            "status": "healthy" if all(
+                service["status"] == "healthy" for service in services.values()
+            ) else "degraded",
+            "services": services,
+            "checked_at": time.time(),
+        }
+        return self.health_snapshot
+
+    async def health_check_services(self, client_for):
+        """Background refresher; ``client_for(name)`` returns the pooled client"""
         while True:
-            for service_name, instances in self.services.items():
-                for instance in instances:
-                    try:
-                        url = f"http://{instance['host']}:{instance['port']}/health"
-                        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
-                            async with session.get(url) as response:
-                                instance["healthy"] = response.status == 200
-                    except Exception as e:
-                        logger.warning(f"Health check failed for {service_name}: {e}")
-                        instance["healthy"] = False
-            
-            await asyncio.sleep(30)  # Check every 30 seconds
-
-# Global service discovery instance
-discovery = ServiceDiscovery()
\ No newline at end of file
+            try:
+                await self.refresh_health(client_for)
+            except Exception as e:
+                logger.error(f"Health refresh failed: {e}")
+            await asyncio.sleep(self.health_check_interval)
+
+    def snapshot(self) -> Dict[str, List[Dict]]:
+        return {
+            name: [instance.to_dict() for instance in instances]
+            for name, instances in self.services.items()
+        }
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import time
+
+import httpx
+
+import app as gateway
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+class PlayersUpstream(httpx.AsyncBaseTransport):
+    """Answers at once, except paths containing ``/slow/``; bodies are streamed like a real upstream's"""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if "/slow/" in request.url.path:
+            await asyncio.sleep(5)
+        return httpx.Response(200, headers={"content-type": "application/json"}, content=self.body())
+
+    async def body(self):
+        yield b'{"ok": true}'
+
+def run_gateway(scenario):
+    """Run ``scenario(client)`` against the gateway with an in-process players upstream"""
+    async def main():
+        await gateway.upstreams.start()
+        gateway.upstreams.clients["players"] = httpx.AsyncClient(transport=PlayersUpstream())
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.loopback_app), base_url="http://gateway")
+        gateway.app.state.loopback = client
+        try:
+            await scenario(client)
+        finally:
+            await client.aclose()
+            await gateway.upstreams.close()
+    asyncio.run(main())
+
+def test_cancelled_half_open_probe_frees_the_breaker():
+    breaker = gateway.breakers["players"]
+    instance = gateway.discovery.pick("players")
+
+    async def scenario(client):
+        # Open, with the open period already over: the next request is the half-open probe
+        breaker.state = OPEN
+        breaker.opened_at = time.monotonic() - breaker.open_seconds
+
+        response = await client.post("/api/batch", json={
+            "timeout": 0.5, "requests": [{"id": "probe", "path": "/api/players/slow/x"}]
+        })
+        assert response.json()["results"][0]["status"] == 504
+        # The batch does not wait for its cancelled sub-requests to unwind
+        await asyncio.sleep(0.1)
+        assert breaker.state == HALF_OPEN
+        assert breaker.probes_in_flight == 0
+        assert instance.outstanding == 0
+
+        response = await client.get("/api/players/1")
+        assert response.status_code == 200
+        assert breaker.state == CLOSED
+
+    run_gateway(scenario)
+
+def test_half_open_breaker_reopens_when_probes_never_report():
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=0.05, half_open_probes=1)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    # The probe is lost; after another open period the breaker re-opens instead of waiting forever
+    time.sleep(0.06)
+    assert not breaker.allow()
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, "1" if default else "0").lower() in ("1", "true", "yes", "on")
+
+
+class PoolStats:
+    """Counters for one upstream pool, used to size the connection limits"""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.slots = asyncio.Semaphore(max_connections)
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.requests = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquired(self, waited: float):
+        self.requests += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        if waited > 0.0005:
+            self.waits += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def released(self):
+        self.in_use -= 1
+        self.slots.release()
+
+
+class UpstreamPool:
+    """One shared, keep-alive httpx client per upstream service.
+
+    Pool limits and HTTP/2 are configured globally through ``UPSTREAM_*``
+    environment variables; connect/read timeouts can be overridden per
+    service with ``<SERVICE>_CONNECT_TIMEOUT`` / ``<SERVICE>_READ_TIMEOUT``
+    (e.g. ``SCORES_READ_TIMEOUT=5``).
+    """
+
+    def __init__(self, services: Dict[str, str]):
+        self.services = services
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, PoolStats] = {}
+        self.max_connections = _env_int("UPSTREAM_MAX_CONNECTIONS", 100)
+        self.max_keepalive = _env_int("UPSTREAM_MAX_KEEPALIVE", 20)
+        self.keepalive_expiry = _env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0)
+        self.pool_timeout = _env_float("UPSTREAM_POOL_TIMEOUT", 5.0)
+        self.http2 = _env_flag("UPSTREAM_HTTP2")
+
+    def _timeout(self, name: str) -> httpx.Timeout:
+        prefix = name.upper()
+        connect = _env_float(f"{prefix}_CONNECT_TIMEOUT", _env_float("UPSTREAM_CONNECT_TIMEOUT", 2.0))
+        read = _env_float(f"{prefix}_READ_TIMEOUT", _env_float("UPSTREAM_READ_TIMEOUT", 30.0))
+        return httpx.Timeout(connect=connect, read=read, write=read, pool=self.pool_timeout)
+
+    async def start(self):
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("UPSTREAM_HTTP2 requested but 'h2' is not installed - using HTTP/1.1")
+                http2 = False
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        for name in self.services:
+            self.clients[name] = httpx.AsyncClient(
+                limits=limits,
+                timeout=self._timeout(name),
+                http2=http2,
+                follow_redirects=True,
+            )
+            self.stats[name] = PoolStats(self.max_connections)
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        return self.clients[name]
+
+    async def send(self, name: str, request: httpx.Request, stream: bool = False,
+                   on_release: Callable[[], None] = None) -> httpx.Response:
+        """Send a request on the service's pooled client.
+
+        With ``stream=True`` the connection slot stays checked out until the
+        caller hands the response back through :meth:`release`.
+        ``on_release`` runs exactly once when the slot is given back.
+        """
+        stats = self.stats[name]
+        started = time.perf_counter()
+        try:
+            if not stats.slots.locked():
+                await stats.slots.acquire()
+            else:
+                await asyncio.wait_for(stats.slots.acquire(), timeout=self.pool_timeout)
+        except asyncio.TimeoutError:
+            if on_release:
+                on_release()
+            raise httpx.PoolTimeout(f"No free connection to {name} within {self.pool_timeout}s", request=request)
+        except BaseException:
+            # Cancelled while waiting for a slot: no slot is held, but the caller's bookkeeping is
+            if on_release:
+                on_release()
+            raise
+        stats.acquired(time.perf_counter() - started)
+
+        try:
+            response = await self.clients[name].send(request, stream=stream)
+        except BaseException:
+            stats.released()
+            if on_release:
+                on_release()
+            raise
+
+        response._pool_on_release = on_release
+        if not stream:
+            response._pool_released = True
+            self._released(name, response)
+        return response
+
+    def _released(self, name: str, response: httpx.Response):
+        self.stats[name].released()
+        if response._pool_on_release:
+            response._pool_on_release()
+
+    async def release(self, name: str, response: httpx.Response):
+        """Close a streamed response and return its slot to the pool.
+
+        Safe to call more than once for the same response.
+        """
+        if getattr(response, "_pool_released", False):
+            return
+        response._pool_released = True
+        try:
+            await response.aclose()
+        finally:
+            self._released(name, response)
+
+    def _connection_counts(self, client: httpx.AsyncClient) -> Optional[Dict[str, int]]:
+        # httpcore does not expose pool occupancy publicly; read it defensively
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return None
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open": len(connections), "idle": idle}
+
+    def snapshot(self) -> Dict[str, Dict]:
+        result = {}
+        for name, stats in self.stats.items():
+            entry = {
+                "in_use": stats.in_use,
+                "peak_in_use": stats.peak_in_use,
+                "max_connections": stats.max_connections,
+                "requests": stats.requests,
+                "waited": stats.waits,
+                "wait_avg_ms": round(stats.wait_total / stats.requests * 1000, 3) if stats.requests else 0.0,
+                "wait_max_ms": round(stats.wait_max * 1000, 3),
+            }
+            counts = self._connection_counts(self.clients[name]) if name in self.clients else None
+            if counts:
+                entry.update(counts)
+            result[name] = entry
+        return result
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Time the hot read queries before and after the schema migrations.
+
+Builds a throwaway SQLite database with synthetic players and scores, drops
+every index the migrations own, times each query, then migrates and times
+them again. The live leaderboard.db is never touched.
+
+    python benchmark_queries.py --players 20000 --scores 300000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, desc, func, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from shared.migrations import MIGRATIONS, migrate, schema_version
+from shared.models import Achievement, Base, Player, PlayerAchievement, PlayerModeStats, Score
+from shared.stats import rebuild
+
+GAME_MODES = ["CLASSIC", "TIME_ATTACK", "SURVIVAL", "PUZZLE"]
+
+def populate(engine, players: int, scores: int):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Player), [
+            {"id": i, "username": f"player{i}", "email": f"player{i}@example.com", "display_name": f"Player {i}"}
+            for i in range(1, players + 1)
+        ])
+        conn.execute(insert(Achievement), [
+            {"id": i, "name": f"Achievement {i}", "description": "", "points": 100} for i in range(1, 11)
+        ])
+        conn.execute(insert(PlayerAchievement), [
+            {"player_id": rng.randint(1, players), "achievement_id": rng.randint(1, 10)}
+            for _ in range(players)
+        ])
+        batch = []
+        for _ in range(scores):
+            batch.append({
+                "player_id": rng.randint(1, players),
+                "game_mode": rng.choice(GAME_MODES),
+                "score": int(rng.paretovariate(1.5) * 1000),
+                "created_at": now - timedelta(seconds=rng.randint(0, 30 * 86400))
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(Score), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Score), batch)
+    db = sessionmaker(bind=engine)()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+
+def hot_queries(db, players: int):
+    """The queries behind the leaderboard, rank, activity, achievement and score listing endpoints"""
+    player_id = players // 2
+    best = db.query(Player.best_score).filter(Player.id == player_id).scalar()
+    mode_best = db.query(PlayerModeStats.best_score).filter(
+        PlayerModeStats.player_id == player_id, PlayerModeStats.game_mode == "CLASSIC"
+    ).scalar() or 0
+    deep_cursor = db.query(Score.score, Score.id).order_by(desc(Score.score), desc(Score.id)).offset(1000).first()
+    return {
+        "global leaderboard": lambda: db.query(
+            Player.id, Player.best_score, Player.total_games
+        ).filter(Player.total_games > 0).order_by(desc(Player.best_score)).limit(10).all(),
+        "global rank": lambda: db.query(func.count()).select_from(Player).filter(
+            Player.total_games > 0, Player.best_score > best
+        ).scalar(),
+        "mode leaderboard": lambda: db.query(
+            PlayerModeStats.player_id, PlayerModeStats.best_score
+        ).filter(PlayerModeStats.game_mode == "CLASSIC").order_by(desc(PlayerModeStats.best_score)).limit(10).all(),
+        "mode rank": lambda: db.query(func.count()).select_from(PlayerModeStats).filter(
+            PlayerModeStats.game_mode == "CLASSIC", PlayerModeStats.best_score > mode_best
+        ).scalar(),
+        "recent activity": lambda: db.query(
+            Score.score, Score.game_mode, Score.created_at, Player.display_name
+        ).join(Player).order_by(desc(Score.created_at)).limit(20).all(),
+        "player achievements": lambda: db.query(PlayerAchievement).filter(
+            PlayerAchievement.player_id == player_id
+        ).join(Achievement).all(),
+        "player scores": lambda: db.query(Score).filter(
+            Score.player_id == player_id
+        ).order_by(desc(Score.score), desc(Score.id)).limit(50).all(),
+        "scores page 21": lambda: db.query(Score).filter(
+            (Score.score < deep_cursor.score) | ((Score.score == deep_cursor.score) & (Score.id < deep_cursor.id))
+        ).order_by(desc(Score.score), desc(Score.id)).limit(50).all(),
+    }
+
+def measure(engine, players: int, repeat: int):
+    db = sessionmaker(bind=engine)()
+    try:
+        results = {}
+        for name, query in hot_queries(db, players).items():
+            query()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                query()
+            results[name] = (time.perf_counter() - started) / repeat * 1000
+        return results
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=20000)
+    parser.add_argument("--scores", type=int, default=300000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+        Base.metadata.create_all(bind=engine)
+        print(f"Populating {args.players} players and {args.scores} scores...")
+        populate(engine, args.players, args.scores)
+
+        # Start from the schema as it was before any migration
+        migrated = [name for _, _, apply in MIGRATIONS for name in getattr(apply, "indexes", [])]
+        with engine.begin() as conn:
+            for name in migrated:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            conn.execute(text("ANALYZE"))
+        before = measure(engine, args.players, args.repeat)
+
+        schema_version.drop(bind=engine, checkfirst=True)
+        migrate(engine)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        after = measure(engine, args.players, args.repeat)
+        engine.dispose()
+
+    print(f"\n{'query':<22}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<22}{before[name]:>12.3f}{after[name]:>12.3f}{before[name] / after[name]:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
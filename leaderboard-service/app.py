@@ -2,17 +2,22 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, Depends, Query
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, select
 from typing import List, Optional
-import redis
-import json
 
-from shared.database import get_db, create_tables
-from shared.models import Score, Player
-from models import LeaderboardEntry
+from shared.database import get_async_db, create_tables, dispose_async_engine
+from shared.cache import LEADERBOARD, AsyncVersionedCache
+from shared.deadline import DeadlineMiddleware
+from shared.metrics import instrument_app
+from shared.redis_clients import connect_async_redis, connect_redis
+from shared.models import Score, Player, PlayerModeStats
+from models import LeaderboardEntry, PlayerRankResult
+from ranking import MemoryRanking, ranking
+from stream import hub
 
 app = FastAPI(title="Leaderboard Service")
 
@@ -24,147 +29,193 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Give up on requests the gateway has already answered
+app.add_middleware(DeadlineMiddleware)
+instrument_app(app, "leaderboard-service")
+
+# Largest number of players in one bulk rank lookup; well below SQLite's bound parameter limit
+RANK_BATCH_MAX = int(os.getenv("RANK_BATCH_MAX", "100"))
+
 # Redis connection
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+redis_client = connect_redis()
+
+# Every leaderboard view is invalidated together whenever a score is submitted
+cache = AsyncVersionedCache(connect_async_redis())
 
 @app.on_event("startup")
-def startup():
+async def startup():
     create_tables()
+    # Subscribe before loading the ranking so no score falls between the two
+    if isinstance(ranking, MemoryRanking):
+        hub.listeners.append(ranking.apply)
+    hub.on_reconnect.append(ranking.reload)
+    hub.start()
+    await ranking.start()
 
-def get_cached_data(key: str, expiry: int = 300):
-    """Get data from Redis cache"""
-    try:
-        cached = redis_client.get(key)
-        if cached:
-            return json.loads(cached)
-    except Exception as e:
-        print(f"Redis get error: {e}")
-    return None
+@app.on_event("shutdown")
+async def shutdown():
+    await hub.stop()
+    await ranking.stop()
+    # aiosqlite connection threads keep the process alive until closed
+    await dispose_async_engine()
 
-def set_cached_data(key: str, data: any, expiry: int = 300):
-    """Set data in Redis cache"""
-    try:
-        redis_client.setex(key, expiry, json.dumps(data, default=str))
-    except Exception as e:
-        print(f"Redis set error: {e}")
+async def leaderboard_entries(db: AsyncSession, game_mode: Optional[str], standings) -> List[LeaderboardEntry]:
+    """Attach names and totals to ranked ``(rank, player_id, best_score)`` rows"""
+    player_ids = [player_id for _, player_id, _ in standings]
+    if not player_ids:
+        return []
+    if game_mode:
+        query = select(
+            Player.id, Player.display_name, Player.username, PlayerModeStats.total_games, PlayerModeStats.total_score
+        ).join(PlayerModeStats).where(PlayerModeStats.game_mode == game_mode, Player.id.in_(player_ids))
+    else:
+        query = select(
+            Player.id, Player.display_name, Player.username, Player.total_games, Player.total_score
+        ).where(Player.id.in_(player_ids))
+    details = {row.id: row for row in await db.execute(query)}
+    
+    result = []
+    for rank, player_id, best_score in standings:
+        row = details.get(player_id)
+        if row is None or not row.total_games:
+            continue
+        result.append(LeaderboardEntry(
+            rank=rank,
+            player_id=player_id,
+            display_name=row.display_name,
+            username=row.username,
+            best_score=best_score,
+            total_games=row.total_games,
+            avg_score=round(row.total_score / row.total_games, 2)
+        ))
+    return result
 
 @app.get("/api/leaderboard/global", response_model=List[LeaderboardEntry])
-def get_global_leaderboard(
+async def get_global_leaderboard(
     limit: int = Query(10, le=100),
     game_mode: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     cache_key = f"leaderboard:global:{limit}:{game_mode or 'all'}"
-    cached = get_cached_data(cache_key)
+    cached = await cache.get(cache_key, [LEADERBOARD])
     
     if cached:
         return [LeaderboardEntry(**item) for item in cached]
     
-    query = db.query(
-        Player.id,
-        Player.display_name,
-        Player.username,
-        func.max(Score.score).label('best_score'),
-        func.count(Score.id).label('total_games'),
-        func.avg(Score.score).label('avg_score')
-    ).join(Score)
-    
-    if game_mode:
-        query = query.filter(Score.game_mode == game_mode)
-    
-    leaderboard_data = query.group_by(Player.id).order_by(
-        desc(func.max(Score.score))
-    ).limit(limit).all()
-    
-    result = []
-    for idx, row in enumerate(leaderboard_data):
-        result.append(LeaderboardEntry(
-            rank=idx + 1,
-            player_id=row.id,
-            display_name=row.display_name,
-            username=row.username,
-            best_score=row.best_score,
-            total_games=row.total_games,
-            avg_score=round(float(row.avg_score), 2) if row.avg_score else 0
-        ))
+    top = await ranking.top(db, game_mode, limit)
+    result = await leaderboard_entries(
+        db, game_mode, [(index + 1, player_id, best_score) for index, (player_id, best_score) in enumerate(top)]
+    )
     
     # Cache for 2 minutes (leaderboard changes frequently)
-    set_cached_data(cache_key, [entry.dict() for entry in result], 120)
+    await cache.set(cache_key, [entry.dict() for entry in result], 120, [LEADERBOARD])
     
     return result
 
 @app.get("/api/leaderboard/gamemode/{game_mode}", response_model=List[LeaderboardEntry])
-def get_gamemode_leaderboard(
+async def get_gamemode_leaderboard(
     game_mode: str,
     limit: int = Query(10, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return get_global_leaderboard(limit=limit, game_mode=game_mode, db=db)
+    return await get_global_leaderboard(limit=limit, game_mode=game_mode, db=db)
 
 @app.get("/api/leaderboard/player/{player_id}/rank")
-def get_player_rank(player_id: int, game_mode: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_player_rank(player_id: int, game_mode: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     cache_key = f"leaderboard:rank:{player_id}:{game_mode or 'all'}"
-    cached = get_cached_data(cache_key)
-    
-    if cached:
-        return cached
-    
-    # Get player's best score
-    query = db.query(func.max(Score.score)).filter(Score.player_id == player_id)
-    if game_mode:
-        query = query.filter(Score.game_mode == game_mode)
+    if ranking.cache_ranks:
+        cached = await cache.get(cache_key, [LEADERBOARD])
+        if cached:
+            return cached
     
-    player_best = query.scalar()
-    if not player_best:
+    standing = await ranking.rank(db, player_id, game_mode)
+    if standing is None:
         result = {"rank": None, "total_players": 0, "best_score": 0}
-        set_cached_data(cache_key, result, 300)
-        return result
+    else:
+        rank, total_players, best_score = standing
+        result = {
+            "rank": rank,
+            "total_players": total_players,
+            "best_score": best_score
+        }
     
-    # Count players with better scores
-    subquery = db.query(
-        Player.id,
-        func.max(Score.score).label('best_score')
-    ).join(Score)
+    # Cache for 5 minutes
+    if ranking.cache_ranks:
+        await cache.set(cache_key, result, 300, [LEADERBOARD])
     
-    if game_mode:
-        subquery = subquery.filter(Score.game_mode == game_mode)
+    return result
+
+@app.get("/api/leaderboard/ranks", response_model=List[PlayerRankResult])
+async def get_player_ranks(
+    player_ids: List[int] = Query([]),
+    game_mode: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ranks of many players in one lookup, in request order; ``rank`` is null for unranked players"""
+    requested = list(dict.fromkeys(player_ids))
+    if not requested or len(requested) > RANK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {RANK_BATCH_MAX} player_ids are required")
     
-    better_players = subquery.group_by(Player.id).having(
-        func.max(Score.score) > player_best
-    ).count()
+    cache_key = f"leaderboard:ranks:{game_mode or 'all'}:{','.join(map(str, sorted(requested)))}"
+    cached = await cache.get(cache_key, [LEADERBOARD]) if ranking.cache_ranks else None
+    if cached:
+        standings = {int(player_id): standing for player_id, standing in cached.items()}
+    else:
+        standings = await ranking.ranks(db, requested, game_mode)
+        if ranking.cache_ranks:
+            # Cached as one entry, dropped with the rest of the leaderboard namespace
+            await cache.set(cache_key, {player_id: list(standing) for player_id, standing in standings.items()},
+                            300, [LEADERBOARD])
     
-    # Get total players
-    total_query = db.query(Player.id).join(Score)
-    if game_mode:
-        total_query = total_query.filter(Score.game_mode == game_mode)
-    total_players = total_query.distinct().count()
+    result = []
+    for player_id in requested:
+        standing = standings.get(player_id)
+        if standing is None:
+            result.append(PlayerRankResult(player_id=player_id, total_players=0, best_score=0))
+        else:
+            rank, total_players, best_score = standing
+            result.append(PlayerRankResult(
+                player_id=player_id, rank=rank, total_players=total_players, best_score=best_score
+            ))
+    return result
+
+@app.get("/api/leaderboard/player/{player_id}/around", response_model=List[LeaderboardEntry])
+async def get_leaderboard_around_player(
+    player_id: int,
+    radius: int = Query(10, ge=0, le=50),
+    game_mode: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """The ``radius`` players ranked above and below a player, and the player; empty if unranked"""
+    cache_key = f"leaderboard:around:{player_id}:{radius}:{game_mode or 'all'}"
+    if ranking.cache_ranks:
+        cached = await cache.get(cache_key, [LEADERBOARD])
+        if cached:
+            return [LeaderboardEntry(**item) for item in cached]
     
-    result = {
-        "rank": better_players + 1,
-        "total_players": total_players,
-        "best_score": player_best
-    }
+    standings = await ranking.around(db, player_id, game_mode, radius)
+    result = await leaderboard_entries(db, game_mode, standings or [])
     
-    # Cache for 5 minutes
-    set_cached_data(cache_key, result, 300)
+    if ranking.cache_ranks:
+        await cache.set(cache_key, [entry.dict() for entry in result], 120, [LEADERBOARD])
     
     return result
 
 @app.get("/api/leaderboard/recent", response_model=List[dict])
-def get_recent_scores(limit: int = Query(20, le=50), db: Session = Depends(get_db)):
+async def get_recent_scores(limit: int = Query(20, le=50), db: AsyncSession = Depends(get_async_db)):
     cache_key = f"leaderboard:recent:{limit}"
-    cached = get_cached_data(cache_key)
+    cached = await cache.get(cache_key, [LEADERBOARD])
     
     if cached:
         return cached
     
-    recent_scores = db.query(
+    recent_scores = (await db.execute(select(
         Score.score,
         Score.game_mode,
         Score.created_at,
         Player.display_name,
         Player.username
-    ).join(Player).order_by(desc(Score.created_at)).limit(limit).all()
+    ).join(Player).order_by(desc(Score.created_at)).limit(limit))).all()
     
     result = [
         {
@@ -178,10 +229,19 @@ def get_recent_scores(limit: int = Query(20, le=50), db: Session = Depends(get_d
     ]
     
     # Cache for 1 minute (recent activity changes frequently)
-    set_cached_data(cache_key, result, 60)
+    await cache.set(cache_key, result, 60, [LEADERBOARD])
     
     return result
 
+@app.get("/api/leaderboard/stream")
+async def stream_leaderboard():
+    """Server-Sent Events: leaderboard deltas and new scores as they are submitted"""
+    return StreamingResponse(
+        hub.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/health")
 def health():
     redis_status = "connected"
@@ -193,7 +253,8 @@ def health():
     return {
         "status": "healthy",
         "service": "leaderboard-service",
-        "redis": redis_status
+        "redis": redis_status,
+        "ranking": ranking.snapshot()
     }
 
 if __name__ == "__main__":
@@ -14,4 +14,10 @@ class LeaderboardEntry(BaseModel):
 class PlayerRank(BaseModel):
     rank: int
     total_players: int
-    best_score: int
\ No newline at end of file
+    best_score: int
+
+class PlayerRankResult(BaseModel):
+    player_id: int
+    rank: Optional[int] = None
+    total_players: int
+    best_score: int
@@ -0,0 +1,487 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import math
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, desc, func, or_, select
+from sqlalchemy.orm import aliased
+from starlette.concurrency import run_in_threadpool
+
+from shared.database import SessionLocal
+from shared.metrics import Gauge
+from shared.models import Player, PlayerModeStats, Score
+from shared.rankings import LEADERBOARD_ENGINE, RANKING_ALL, ranking_key, rebuild
+from shared.redis_clients import connect_async_redis, connect_redis
+
+# The in-memory index reads new rows of the scores table this often, so a score whose
+# event was lost on the pub/sub channel is ranked at most this late
+RANKING_CATCHUP_SECONDS = float(os.getenv("RANKING_CATCHUP_SECONDS", "1"))
+RANKING_CATCHUP_BATCH = int(os.getenv("RANKING_CATCHUP_BATCH", "5000"))
+# Full reload of the in-memory index, dropping deleted players
+RANKING_RESYNC_SECONDS = float(os.getenv("RANKING_RESYNC_SECONDS", "300"))
+
+# (player_id, best_score) in leaderboard order
+Leaders = List[Tuple[int, int]]
+# (rank, total_players, best_score)
+Rank = Tuple[int, int, int]
+# (rank, player_id, best_score) in leaderboard order
+Standings = List[Tuple[int, int, int]]
+
+def ranked(leaders: Leaders, start: int, first_rank: int) -> Standings:
+    """Rank a run of leaders beginning at position ``start``, where the first has ``first_rank``.
+
+    Players sharing a score share the rank of the first of them, so the rank
+    only moves on to the position when the score changes.
+    """
+    standings = []
+    rank = first_rank
+    for offset, (player_id, best) in enumerate(leaders):
+        if offset and best != leaders[offset - 1][1]:
+            rank = start + offset + 1
+        standings.append((rank, player_id, best))
+    return standings
+
+class IndexableSkiplist:
+    """Sorted sequence with O(log n) insert, remove, positional lookup and bisect.
+
+    Every link records how many items it skips, so walking from the head
+    towards a value also counts how many items precede it.
+    """
+    MAX_LEVELS = 24
+
+    class Node:
+        __slots__ = ("value", "next", "width")
+
+        def __init__(self, value, levels: int):
+            self.value = value
+            self.next = [None] * levels
+            self.width = [1] * levels
+
+    def __init__(self):
+        self.tail = self.Node((math.inf, math.inf), 0)
+        self.head = self.Node(None, self.MAX_LEVELS)
+        self.head.next = [self.tail] * self.MAX_LEVELS
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _path(self, value):
+        """Last node before ``value`` on every level, and how far along each one is"""
+        chain = [None] * self.MAX_LEVELS
+        positions = [0] * self.MAX_LEVELS
+        node, position = self.head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, value):
+        chain, positions = self._path(value)
+        levels = min(self.MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        node = self.Node(value, levels)
+        for level in range(levels):
+            previous = chain[level]
+            skipped = positions[0] - positions[level]
+            node.next[level] = previous.next[level]
+            node.width[level] = previous.width[level] - skipped
+            previous.next[level] = node
+            previous.width[level] = skipped + 1
+        for level in range(levels, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain, _ = self._path(value)
+        node = chain[0].next[0]
+        if node.value != value:
+            raise KeyError(value)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def bisect_left(self, value) -> int:
+        """Number of items smaller than ``value``"""
+        _, positions = self._path(value)
+        return positions[0]
+
+    def iterate_from(self, index: int) -> Iterable:
+        """Items in order starting at position ``index``"""
+        if index >= self.size:
+            return
+        node, remaining = self.head, index + 1
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.width[level] <= remaining and node.next[level] is not self.tail:
+                remaining -= node.width[level]
+                node = node.next[level]
+        while node is not self.tail:
+            if node is not self.head:
+                yield node.value
+            node = node.next[0]
+
+class RankBoard:
+    """Best score per player for one leaderboard, ordered best first (ties by player id)"""
+
+    def __init__(self):
+        self.best: Dict[int, int] = {}
+        self.order = IndexableSkiplist()
+
+    def set_best(self, player_id: int, best: int):
+        previous = self.best.get(player_id)
+        if previous == best:
+            return
+        if previous is not None:
+            self.order.remove((-previous, player_id))
+        self.best[player_id] = best
+        self.order.insert((-best, player_id))
+
+    def rank(self, player_id: int) -> Optional[Rank]:
+        best = self.best.get(player_id)
+        if best is None:
+            return None
+        # Players sharing a score share a rank: count only strictly better ones
+        better = self.order.bisect_left((-best, -math.inf))
+        return better + 1, len(self.order), best
+
+    def top(self, limit: int) -> Leaders:
+        return self.slice(0, limit)
+
+    def slice(self, start: int, limit: int) -> Leaders:
+        leaders = []
+        for negative_best, player_id in self.order.iterate_from(start):
+            if len(leaders) == limit:
+                break
+            leaders.append((player_id, -negative_best))
+        return leaders
+
+    def around(self, player_id: int, radius: int) -> Optional[Standings]:
+        best = self.best.get(player_id)
+        if best is None:
+            return None
+        position = self.order.bisect_left((-best, player_id))
+        start = max(position - radius, 0)
+        leaders = self.slice(start, position - start + radius + 1)
+        return ranked(leaders, start, self.order.bisect_left((-leaders[0][1], -math.inf)) + 1)
+
+class SqlRanking:
+    """Ranks straight from the maintained stats tables"""
+    name = "sql"
+    # Rank lookups are two aggregate queries, worth caching in Redis
+    cache_ranks = True
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def reload(self):
+        pass
+
+    def _board(self, game_mode: Optional[str], alias: bool = False):
+        if game_mode:
+            totals = aliased(PlayerModeStats) if alias else PlayerModeStats
+            return totals, totals.player_id, [totals.game_mode == game_mode]
+        totals = aliased(Player) if alias else Player
+        return totals, totals.id, [totals.total_games > 0]
+
+    async def top(self, db, game_mode: Optional[str], limit: int) -> Leaders:
+        totals, player_id, board = self._board(game_mode)
+        rows = await db.execute(
+            select(player_id, totals.best_score).where(*board).order_by(desc(totals.best_score), player_id).limit(limit)
+        )
+        return [tuple(row) for row in rows]
+
+    async def rank(self, db, player_id: int, game_mode: Optional[str]) -> Optional[Rank]:
+        totals, id_column, board = self._board(game_mode)
+        best = await db.scalar(select(totals.best_score).where(id_column == player_id, *board))
+        if not best:
+            return None
+        counted = select(func.count()).select_from(totals).where(*board)
+        better = await db.scalar(counted.where(totals.best_score > best))
+        return better + 1, await db.scalar(counted), best
+
+    async def ranks(self, db, player_ids: List[int], game_mode: Optional[str]) -> Dict[int, Rank]:
+        totals, id_column, board = self._board(game_mode)
+        others, _, other_board = self._board(game_mode, alias=True)
+        # One statement: each requested row counts the rows above it through the best_score index
+        better = select(func.count()).select_from(others).where(
+            *other_board, others.best_score > totals.best_score
+        ).scalar_subquery()
+        rows = (await db.execute(
+            select(id_column, totals.best_score, better).where(id_column.in_(player_ids), totals.best_score > 0, *board)
+        )).all()
+        if not rows:
+            return {}
+        total = await db.scalar(select(func.count()).select_from(totals).where(*board))
+        return {player_id: (above + 1, total, best) for player_id, best, above in rows}
+
+    async def around(self, db, player_id: int, game_mode: Optional[str], radius: int) -> Optional[Standings]:
+        totals, id_column, board = self._board(game_mode)
+        best = await db.scalar(select(totals.best_score).where(id_column == player_id, *board))
+        if not best:
+            return None
+        # Keyset reads either side of the player, in leaderboard order (best first, ties by id)
+        columns = select(id_column, totals.best_score).where(*board)
+        above = await db.execute(
+            columns.where(or_(totals.best_score > best, and_(totals.best_score == best, id_column < player_id)))
+            .order_by(totals.best_score, desc(id_column)).limit(radius)
+        )
+        below = await db.execute(
+            columns.where(or_(totals.best_score < best, and_(totals.best_score == best, id_column > player_id)))
+            .order_by(desc(totals.best_score), id_column).limit(radius)
+        )
+        leaders = [tuple(row) for row in reversed(above.all())] + [(player_id, best)] + [tuple(row) for row in below]
+
+        first_id, first_best = leaders[0]
+        counted = select(func.count()).select_from(totals).where(*board)
+        better = await db.scalar(counted.where(totals.best_score > first_best))
+        tied_before = await db.scalar(counted.where(totals.best_score == first_best, id_column < first_id))
+        return ranked(leaders, better + tied_before, better + 1)
+
+    def snapshot(self):
+        return {"engine": self.name}
+
+class MemoryRanking:
+    """Order-statistic index per game mode plus the global board, held in process.
+
+    Built from the stats tables at startup and kept current from the score
+    events the stream hub receives, raising best scores straight from each
+    event's payload. Events are best effort, so every
+    ``RANKING_CATCHUP_SECONDS`` the scores table is also read past the last
+    id applied: SQLite has one writer at a time, so committed score ids only
+    grow and none is skipped. Applying a score twice is harmless, best scores
+    only go up. Reloaded every ``RANKING_RESYNC_SECONDS`` and after the event
+    subscription reconnects. Rank lookups never touch SQLite.
+    """
+    name = "memory"
+    # An index lookup is cheaper than the Redis round trip
+    cache_ranks = False
+
+    def __init__(self):
+        self.boards: Dict[Optional[str], RankBoard] = {}
+        # Id of the last row of the scores table included in the boards
+        self.position = 0
+        # Updates that arrive while a reload is reading the database
+        self.pending: Optional[list] = None
+        self.task: Optional[asyncio.Task] = None
+        # Reloads and catch-ups both move the position; one at a time
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        await self.reload()
+        self.task = asyncio.create_task(self.follow())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def follow(self):
+        loop = asyncio.get_running_loop()
+        reload_at = loop.time() + RANKING_RESYNC_SECONDS
+        while True:
+            await asyncio.sleep(RANKING_CATCHUP_SECONDS)
+            try:
+                if loop.time() >= reload_at:
+                    reload_at = loop.time() + RANKING_RESYNC_SECONDS
+                    await self.reload()
+                else:
+                    await self.catch_up()
+            except Exception as e:
+                print(f"Ranking update failed: {e}")
+
+    async def reload(self):
+        async with self.lock:
+            self.pending = []
+            try:
+                boards, position = await run_in_threadpool(load_boards)
+                for score in self.pending:
+                    record_score(boards, score)
+                self.boards = boards
+                self.position = position
+            finally:
+                self.pending = None
+
+    async def catch_up(self):
+        """Apply the rows added to the scores table since the last one applied"""
+        async with self.lock:
+            while True:
+                scores = await run_in_threadpool(scores_after, self.position, RANKING_CATCHUP_BATCH)
+                for score in scores:
+                    record_score(self.boards, score)
+                if scores:
+                    self.position = scores[-1]["id"]
+                if len(scores) < RANKING_CATCHUP_BATCH:
+                    return
+
+    def apply(self, score: dict):
+        """Take in one score event; best scores only go up"""
+        if self.pending is not None:
+            self.pending.append(score)
+        record_score(self.boards, score)
+
+    async def top(self, db, game_mode: Optional[str], limit: int) -> Leaders:
+        board = self.boards.get(game_mode)
+        return board.top(limit) if board else []
+
+    async def rank(self, db, player_id: int, game_mode: Optional[str]) -> Optional[Rank]:
+        board = self.boards.get(game_mode)
+        return board.rank(player_id) if board else None
+
+    async def ranks(self, db, player_ids: List[int], game_mode: Optional[str]) -> Dict[int, Rank]:
+        board = self.boards.get(game_mode)
+        if board is None:
+            return {}
+        standings = {player_id: board.rank(player_id) for player_id in player_ids}
+        return {player_id: standing for player_id, standing in standings.items() if standing}
+
+    async def around(self, db, player_id: int, game_mode: Optional[str], radius: int) -> Optional[Standings]:
+        board = self.boards.get(game_mode)
+        return board.around(player_id, radius) if board else None
+
+    def snapshot(self):
+        return {
+            "engine": self.name,
+            "boards": {game_mode or "all": len(board.best) for game_mode, board in self.boards.items()}
+        }
+
+class RedisRanking:
+    """Sorted sets in Redis, shared by every leaderboard replica.
+
+    The score service raises best scores with ``ZADD GT`` as it writes them
+    (see ``shared.rankings``). The sets are rebuilt from the stats tables
+    when missing at startup and after the event subscription reconnects,
+    since writes made while Redis was unreachable never reached them.
+    """
+    name = "redis"
+    # Reads are already single Redis round trips
+    cache_ranks = False
+
+    def __init__(self):
+        self.redis = connect_async_redis()
+
+    async def start(self):
+        try:
+            if not await self.redis.exists(RANKING_ALL):
+                await self.reload()
+        except Exception as e:
+            print(f"Ranking rebuild failed: {e}")
+
+    async def stop(self):
+        await self.redis.close()
+
+    async def reload(self):
+        await run_in_threadpool(rebuild_sorted_sets)
+
+    async def top(self, db, game_mode: Optional[str], limit: int) -> Leaders:
+        return await self.top_slice(ranking_key(game_mode), 0, limit)
+
+    async def rank(self, db, player_id: int, game_mode: Optional[str]) -> Optional[Rank]:
+        key = ranking_key(game_mode)
+        best = await self.redis.zscore(key, str(player_id))
+        if best is None:
+            return None
+        # ZREVRANK orders ties by member; counting strictly better scores lets ties share a rank
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zcount(key, f"({best}", "+inf")
+        pipeline.zcard(key)
+        better, total = await pipeline.execute()
+        return better + 1, total, int(best)
+
+    async def ranks(self, db, player_ids: List[int], game_mode: Optional[str]) -> Dict[int, Rank]:
+        key = ranking_key(game_mode)
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zcard(key)
+        for player_id in player_ids:
+            pipeline.zscore(key, str(player_id))
+        total, *scores = await pipeline.execute()
+        bests = {player_id: best for player_id, best in zip(player_ids, scores) if best is not None}
+        if not bests:
+            return {}
+        # Second round trip: one ZCOUNT per distinct score
+        distinct = sorted(set(bests.values()))
+        pipeline = self.redis.pipeline(transaction=False)
+        for best in distinct:
+            pipeline.zcount(key, f"({best}", "+inf")
+        better = dict(zip(distinct, await pipeline.execute()))
+        return {player_id: (better[best] + 1, total, int(best)) for player_id, best in bests.items()}
+
+    async def around(self, db, player_id: int, game_mode: Optional[str], radius: int) -> Optional[Standings]:
+        key = ranking_key(game_mode)
+        position = await self.redis.zrevrank(key, str(player_id))
+        if position is None:
+            return None
+        start = max(position - radius, 0)
+        leaders = await self.top_slice(key, start, position - start + radius + 1)
+        better = await self.redis.zcount(key, f"({leaders[0][1]}", "+inf")
+        return ranked(leaders, start, better + 1)
+
+    async def top_slice(self, key: str, start: int, limit: int) -> Leaders:
+        leaders = await self.redis.zrevrange(key, start, start + limit - 1, withscores=True)
+        return [(int(player_id), int(best)) for player_id, best in leaders]
+
+    def snapshot(self):
+        return {"engine": self.name}
+
+def rebuild_sorted_sets():
+    db = SessionLocal()
+    try:
+        rebuild(connect_redis(), db)
+    finally:
+        db.close()
+
+def record_score(boards: Dict[Optional[str], RankBoard], score: dict):
+    """Raise the player's best on the overall board and the board of the score's game mode"""
+    for game_mode in (None, score["game_mode"]):
+        board = boards.setdefault(game_mode, RankBoard())
+        board.set_best(score["player_id"], max(board.best.get(score["player_id"], score["score"]), score["score"]))
+
+def load_boards() -> Tuple[Dict[Optional[str], RankBoard], int]:
+    """The boards, and the id of the last score they are known to include"""
+    db = SessionLocal()
+    try:
+        # Read before the stats: scores committed in between are applied again by the next catch-up
+        position = db.query(func.max(Score.id)).scalar() or 0
+        boards: Dict[Optional[str], RankBoard] = {None: RankBoard()}
+        for player_id, best in db.query(Player.id, Player.best_score).filter(Player.total_games > 0):
+            boards[None].set_best(player_id, best)
+        rows = db.query(PlayerModeStats.game_mode, PlayerModeStats.player_id, PlayerModeStats.best_score)
+        for game_mode, player_id, best in rows:
+            boards.setdefault(game_mode, RankBoard()).set_best(player_id, best)
+        return boards, position
+    finally:
+        db.close()
+
+def scores_after(position: int, limit: int) -> List[dict]:
+    db = SessionLocal()
+    try:
+        rows = db.query(Score.id, Score.player_id, Score.game_mode, Score.score).filter(
+            Score.id > position
+        ).order_by(Score.id).limit(limit)
+        return [{"id": score_id, "player_id": player_id, "game_mode": game_mode, "score": score}
+                for score_id, player_id, game_mode, score in rows]
+    finally:
+        db.close()
+
+ENGINES = {"sql": SqlRanking, "memory": MemoryRanking, "redis": RedisRanking}
+
+if LEADERBOARD_ENGINE not in ENGINES:
+    raise ValueError(f"LEADERBOARD_ENGINE must be one of {', '.join(ENGINES)}")
+ranking = ENGINES[LEADERBOARD_ENGINE]()
+
+Gauge(
+    "leaderboard_ranking_players", "Players held per in-memory leaderboard", ["game_mode"],
+    collect=lambda: [({"game_mode": game_mode or "all"}, len(board.best))
+                     for game_mode, board in getattr(ranking, "boards", {}).items()]
+)
@@ -0,0 +1,160 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+from typing import Callable, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from shared.database import SessionLocal
+from shared.events import SCORE_EVENTS_CHANNEL
+from shared.metrics import Gauge
+from shared.models import Player, PlayerModeStats
+from shared.redis_clients import connect_async_redis
+
+# Seconds between keep-alive comments on idle streams
+HEARTBEAT_INTERVAL = 15
+# Events buffered per subscriber before it is considered too slow and dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+def format_event(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+def leaderboard_entry(db, player_id: int, game_mode: Optional[str]) -> Optional[dict]:
+    """Current standing of one player, shaped like a LeaderboardEntry without rank"""
+    if game_mode:
+        row = db.query(
+            Player.id, Player.display_name, Player.username,
+            PlayerModeStats.best_score, PlayerModeStats.total_games, PlayerModeStats.total_score
+        ).join(PlayerModeStats).filter(
+            Player.id == player_id, PlayerModeStats.game_mode == game_mode
+        ).first()
+    else:
+        row = db.query(
+            Player.id, Player.display_name, Player.username,
+            Player.best_score, Player.total_games, Player.total_score
+        ).filter(Player.id == player_id, Player.total_games > 0).first()
+    if row is None:
+        return None
+    return {
+        "player_id": row.id,
+        "display_name": row.display_name,
+        "username": row.username,
+        "best_score": row.best_score,
+        "total_games": row.total_games,
+        "avg_score": round(row.total_score / row.total_games, 2)
+    }
+
+def build_events(score: dict) -> List[bytes]:
+    """Deltas for the overall and per-mode boards plus the recent-score event"""
+    db = SessionLocal()
+    try:
+        events = []
+        for game_mode in (None, score["game_mode"]):
+            entry = leaderboard_entry(db, score["player_id"], game_mode)
+            if entry:
+                events.append(format_event("leaderboard", {"game_mode": game_mode, "entry": entry}))
+        player = db.query(Player.display_name, Player.username).filter(Player.id == score["player_id"]).first()
+        if player:
+            events.append(format_event("score", {
+                "score": score["score"],
+                "game_mode": score["game_mode"],
+                "created_at": score["created_at"],
+                "display_name": player.display_name,
+                "username": player.username
+            }))
+        return events
+    finally:
+        db.close()
+
+class LeaderboardHub:
+    """Fans score events out to connected Server-Sent Events clients.
+
+    One Redis subscription per process feeds every client; each client only
+    costs a small bounded queue, so thousands of idle streams stay cheap.
+    Listeners get every raw score event, with or without clients, and must
+    not block; the database is only read to build deltas while clients are
+    connected. ``on_reconnect`` callbacks run when the subscription comes
+    back after an outage, as events may have been missed meanwhile.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.listeners: List[Callable] = []
+        self.on_reconnect: List[Callable] = []
+
+    def start(self):
+        self.task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def listen(self):
+        interrupted = False
+        while True:
+            client = connect_async_redis()
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(SCORE_EVENTS_CHANNEL)
+                if interrupted:
+                    interrupted = False
+                    for callback in self.on_reconnect:
+                        await callback()
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    score = json.loads(message["data"])
+                    for listener in self.listeners:
+                        listener(score)
+                    if self.subscribers:
+                        self.broadcast(await run_in_threadpool(build_events, score))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Score event subscription error: {e}")
+                interrupted = True
+                await asyncio.sleep(2)
+            finally:
+                await client.close()
+
+    def broadcast(self, events: List[bytes]):
+        for queue in list(self.subscribers):
+            try:
+                for event in events:
+                    queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop it, the browser reconnects and resyncs
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.dropped += 1
+
+    async def stream(self):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.subscribers.discard(queue)
+
+hub = LeaderboardHub()
+
+Gauge(
+    "leaderboard_stream_subscribers", "Connected live leaderboard streams",
+    collect=lambda: [({}, len(hub.subscribers))]
+)
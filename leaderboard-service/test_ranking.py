@@ -0,0 +1,121 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import bisect
+import math
+import random
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import ranking
+from ranking import IndexableSkiplist, MemoryRanking, RankBoard
+from shared.models import Base, Player, PlayerModeStats, Score
+
+def test_skiplist_matches_a_sorted_list():
+    rng = random.Random(7)
+    # Level choice uses the module's random; seed it so a failure reproduces
+    ranking.random.seed(7)
+    skiplist = IndexableSkiplist()
+    expected = []
+    for step in range(5000):
+        if expected and rng.random() < 0.4:
+            value = rng.choice(expected)
+            skiplist.remove(value)
+            expected.remove(value)
+        else:
+            # Few distinct scores, so runs of equal first elements are common
+            value = (-rng.randint(0, 50), rng.randint(1, 10**6))
+            if value in expected:
+                continue
+            skiplist.insert(value)
+            bisect.insort(expected, value)
+
+        assert len(skiplist) == len(expected)
+        probe = (-rng.randint(-1, 51), rng.choice([-math.inf, rng.randint(1, 10**6)]))
+        assert skiplist.bisect_left(probe) == bisect.bisect_left(expected, probe)
+        start = rng.randint(0, len(expected) + 2)
+        assert list(skiplist.iterate_from(start))[:20] == expected[start:start + 20]
+        if step % 500 == 0:
+            assert list(skiplist.iterate_from(0)) == expected
+
+def test_skiplist_remove_missing_value_raises():
+    skiplist = IndexableSkiplist()
+    skiplist.insert((1, 1))
+    try:
+        skiplist.remove((1, 2))
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("removing a missing value should raise KeyError")
+    assert list(skiplist.iterate_from(0)) == [(1, 1)]
+
+def test_rank_board_matches_brute_force():
+    rng = random.Random(11)
+    board = RankBoard()
+    best = {}
+    for _ in range(3000):
+        player_id = rng.randint(1, 200)
+        score = rng.randint(0, 40)
+        best[player_id] = max(best.get(player_id, score), score)
+        board.set_best(player_id, best[player_id])
+
+    order = sorted(best, key=lambda player_id: (-best[player_id], player_id))
+    assert board.top(25) == [(player_id, best[player_id]) for player_id in order[:25]]
+    for player_id in rng.sample(sorted(best), 50):
+        better = sum(1 for other in best.values() if other > best[player_id])
+        assert board.rank(player_id) == (better + 1, len(best), best[player_id])
+
+        radius = rng.randint(0, 5)
+        position = order.index(player_id)
+        window = order[max(position - radius, 0):position + radius + 1]
+        assert [(player_id, score) for _, player_id, score in board.around(player_id, radius)] == \
+            [(other, best[other]) for other in window]
+        assert [rank for rank, _, _ in board.around(player_id, radius)] == \
+            [sum(1 for score in best.values() if score > best[other]) + 1 for other in window]
+    assert board.rank(10**6) is None
+
+def test_memory_ranking_catches_up_with_scores_whose_event_was_lost(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/leaderboard.db")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(ranking, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(ranking, "RANKING_CATCHUP_BATCH", 2)
+    db = ranking.SessionLocal()
+    for player_id in (1, 2, 3):
+        db.add(Player(id=player_id, username=f"player{player_id}", email=f"player{player_id}@example.com",
+                      total_games=int(player_id < 3), best_score=10 * player_id if player_id < 3 else 0))
+    db.add_all([PlayerModeStats(player_id=1, game_mode="CLASSIC", total_games=1, total_score=10, best_score=10),
+                PlayerModeStats(player_id=2, game_mode="CLASSIC", total_games=1, total_score=20, best_score=20),
+                Score(player_id=1, game_mode="CLASSIC", score=10), Score(player_id=2, game_mode="CLASSIC", score=20)])
+    db.commit()
+
+    async def main():
+        memory = MemoryRanking()
+        await memory.reload()
+        assert memory.position == 2
+        assert await memory.top(None, None, 10) == [(2, 20), (1, 10)]
+
+        # Committed without their events reaching this replica
+        db.add_all([Score(player_id=1, game_mode="CLASSIC", score=30), Score(player_id=3, game_mode="ARCADE", score=5),
+                    Score(player_id=1, game_mode="CLASSIC", score=15), Score(player_id=2, game_mode="ARCADE", score=1),
+                    Score(player_id=3, game_mode="ARCADE", score=7)])
+        db.commit()
+        await memory.catch_up()
+        assert memory.position == 7
+        assert await memory.top(None, None, 10) == [(1, 30), (2, 20), (3, 7)]
+        assert await memory.top(None, "ARCADE", 10) == [(3, 7), (2, 1)]
+        assert await memory.rank(None, 1, "CLASSIC") == (1, 2, 30)
+
+        # The same scores arriving late as events change nothing
+        memory.apply({"player_id": 1, "game_mode": "CLASSIC", "score": 15})
+        await memory.catch_up()
+        assert memory.position == 7
+        assert await memory.rank(None, 1, None) == (1, 3, 30)
+
+    try:
+        asyncio.run(main())
+    finally:
+        db.close()
+        engine.dispose()
@@ -0,0 +1,126 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import ranking
+from ranking import RedisRanking, SqlRanking
+from shared.models import Base, Player, PlayerModeStats
+from shared.rankings import RANKING_ALL, RANKING_REBUILD_LOCK, rebuild
+
+fakeredis = pytest.importorskip("fakeredis")
+
+MODES = ["CLASSIC", "BLITZ"]
+BOARDS = [None] + MODES
+
+@pytest.fixture
+def database(tmp_path):
+    """A seeded SQLite file: 80 players, few distinct best scores so most of them tie"""
+    url = f"sqlite:///{tmp_path}/leaderboard.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(5)
+    db = sessionmaker(bind=engine)()
+    for player_id in range(1, 81):
+        # Every fifth player has not played and is on no board
+        bests = {mode: rng.randint(1, 12) for mode in MODES if player_id % 5 and rng.random() < 0.8}
+        db.add(Player(
+            id=player_id, username=f"player{player_id}", email=f"player{player_id}@example.com",
+            total_games=len(bests), best_score=max(bests.values(), default=0)
+        ))
+        for mode, best in bests.items():
+            db.add(PlayerModeStats(player_id=player_id, game_mode=mode, total_games=1, total_score=best, best_score=best))
+    db.commit()
+    yield db, url
+    db.close()
+    engine.dispose()
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(ranking, "connect_async_redis", lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+def run(url, scenario):
+    """Run ``scenario(sql, redis_ranking, session)`` with both engines over the same database"""
+    async def main():
+        engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+        redis_ranking = RedisRanking()
+        try:
+            async with async_sessionmaker(engine, class_=AsyncSession)() as session:
+                await scenario(SqlRanking(), redis_ranking, session)
+        finally:
+            await redis_ranking.stop()
+            await engine.dispose()
+    asyncio.run(main())
+
+def test_redis_engine_matches_sql_engine(database, fake_redis):
+    db, url = database
+    sizes = rebuild(fake_redis, db)
+    assert sizes[RANKING_ALL] == 64
+
+    async def scenario(sql, redis_ranking, session):
+        player_ids = list(range(0, 83))
+        for game_mode in BOARDS:
+            # Tied players are ordered by id in SQL and by member in Redis: same scores, same players
+            everyone = await sql.top(session, game_mode, 1000)
+            ordered = await redis_ranking.top(session, game_mode, 1000)
+            assert sorted(ordered) == sorted(everyone)
+            assert [best for _, best in ordered] == [best for _, best in everyone]
+            for limit in (1, 7, 30):
+                assert [best for _, best in await redis_ranking.top(session, game_mode, limit)] == \
+                    [best for _, best in everyone[:limit]]
+
+            expected = {}
+            for player_id in player_ids:
+                rank = await sql.rank(session, player_id, game_mode)
+                assert await redis_ranking.rank(session, player_id, game_mode) == rank
+                if rank:
+                    expected[player_id] = rank
+            assert await sql.ranks(session, player_ids, game_mode) == expected
+            assert await redis_ranking.ranks(session, player_ids, game_mode) == expected
+
+            for engine, leaders in ((sql, everyone), (redis_ranking, ordered)):
+                members = [player_id for player_id, _ in leaders]
+                for player_id in [members[0], members[1], members[len(members) // 2], members[-1], 0, 5]:
+                    for radius in (0, 2, 5):
+                        window = await engine.around(session, player_id, game_mode, radius)
+                        if player_id not in expected:
+                            assert window is None
+                            continue
+                        position = members.index(player_id)
+                        assert [member for _, member, _ in window] == members[max(position - radius, 0):position + radius + 1]
+                        assert [(rank, best) for rank, _, best in window] == \
+                            [expected[member][::2] for _, member, _ in window]
+
+    run(url, scenario)
+
+def test_rebuild_skips_while_another_holds_the_lock(database, fake_redis):
+    db, url = database
+    fake_redis.set(RANKING_REBUILD_LOCK, "other", px=60000)
+    assert rebuild(fake_redis, db) is None
+    assert fake_redis.get(RANKING_REBUILD_LOCK) == "other"
+    assert fake_redis.keys("ranking:*") == [RANKING_REBUILD_LOCK]
+
+    fake_redis.delete(RANKING_REBUILD_LOCK)
+    assert rebuild(fake_redis, db)[RANKING_ALL] == 64
+    assert not fake_redis.exists(RANKING_REBUILD_LOCK)
+    assert fake_redis.keys("*:rebuild:*") == []
+
+def test_rebuild_merges_into_the_live_sets(database, fake_redis):
+    db, url = database
+    rebuild(fake_redis, db)
+    # A raise written with ZADD GT after the snapshot, and a member the database no longer ranks
+    fake_redis.zadd(RANKING_ALL, {"1": 1000}, gt=True)
+    fake_redis.zadd(RANKING_ALL, {"999": 50})
+    rebuild(fake_redis, db)
+    assert fake_redis.zscore(RANKING_ALL, "1") == 1000
+    assert fake_redis.zscore(RANKING_ALL, "999") is None
+    assert fake_redis.zcard(RANKING_ALL) == 64
@@ -8,6 +8,7 @@ import asyncio
 from contextlib import asynccontextmanager
 
 from shared.database import create_tables
+from shared.metrics import instrument_app
 from shared.service_registry import registry
 from routes import router  # Change from .routes to routes
 
@@ -34,6 +35,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "player-service")
+
 app.include_router(router)
 
 @app.get("/health")
@@ -18,9 +18,8 @@ def run_service(service_dir, port):
 def check_redis():
     """Check if Redis is running"""
     try:
-        import redis
-        r = redis.Redis(host='localhost', port=6379, db=0)
-        r.ping()
+        from shared.redis_clients import connect_redis
+        connect_redis().ping()
         print("✅ Redis is running")
         return True
     except Exception as e:
@@ -2,19 +2,33 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from typing import List
-import redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Optional
+import queue
 import json
-import httpx
+import concurrent.futures
 from datetime import datetime
 
-from shared.database import get_db, create_tables
-from shared.models import Score, Player
-from models import ScoreCreate, ScoreResponse
+from shared.database import ID_LOOKUP_CHUNK, get_db, get_async_db, create_tables, dispose_async_engine, SessionLocal
+from shared.events import publish_score_event
+from shared.idempotency import IDEMPOTENCY_REQUESTS, IdempotencyStore, fingerprint
+from shared.cache import LEADERBOARD, AsyncVersionedCache, VersionedCache, player_namespace
+from shared.deadline import DeadlineMiddleware
+from shared.metrics import Gauge, instrument_app
+from shared.models import Score, Player, PlayerModeStats
+from shared.outbox import add_score_events
+from shared.rankings import LEADERBOARD_ENGINE, record_best_scores
+from shared.redis_clients import connect_async_redis, connect_redis
+from shared.stats import ensure_built, record_scores
+from models import ScoreCreate, ScoreResponse, ScoreBatchCreate, ScoreBatchItem, ScoreBatchResponse
+from ingest import INGEST_ACK_TIMEOUT, INGEST_MODE, ScoreWriter, insert_scores
+from pagination import MAX_PAGE_SIZE, keyset_page, set_page_headers
 
 app = FastAPI(title="Score Service")
 
@@ -26,51 +40,148 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Give up on requests the gateway has already answered
+app.add_middleware(DeadlineMiddleware)
+instrument_app(app, "score-service")
+
+# Largest number of scores accepted by one batch submission
+SCORE_BATCH_MAX = int(os.getenv("SCORE_BATCH_MAX", "5000"))
+
 # Redis connection
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+redis_client = connect_redis()
+
+# Per-player caches and the leaderboards are invalidated by bumping their namespace
+cache = VersionedCache(redis_client)
+# The same cache for the async read endpoints, which must not block the event loop
+async_cache = AsyncVersionedCache(connect_async_redis())
+
+# Responses to Idempotency-Key'd submissions, replayed to retries
+idempotency = IdempotencyStore(redis_client)
+
+# Group-commit writer, only used when SCORE_INGEST_MODE=queued
+writer = None
 
 @app.on_event("startup")
-def startup():
+async def startup():
+    global writer
     create_tables()
-
-def get_cached_data(key: str, expiry: int = 300):
-    """Get data from Redis cache"""
+    db = SessionLocal()
     try:
-        cached = redis_client.get(key)
-        if cached:
-            return json.loads(cached)
-    except Exception as e:
-        print(f"Redis get error: {e}")
-    return None
+        ensure_built(db)
+    finally:
+        db.close()
+    if INGEST_MODE == "queued":
+        writer = ScoreWriter(on_flushed=scores_written)
+        writer.start()
 
-def set_cached_data(key: str, data: any, expiry: int = 300):
-    """Set data in Redis cache"""
-    try:
-        redis_client.setex(key, expiry, json.dumps(data, default=str))
-    except Exception as e:
-        print(f"Redis set error: {e}")
+@app.on_event("shutdown")
+async def shutdown():
+    if writer is not None:
+        writer.stop()
+    # aiosqlite connection threads keep the process alive until closed
+    await dispose_async_engine()
+
+Gauge("score_ingest_queue_depth", "Scores waiting for the group-commit writer",
+      collect=lambda: [({}, writer.depth() if writer else 0)])
+
+def scores_written(scores: List[Score]):
+    """Invalidate each affected cache namespace once and announce each player's latest score per mode"""
+    if LEADERBOARD_ENGINE == "redis":
+        # Before invalidating, so a reader refilling the cache sees the new best scores
+        record_best_scores(redis_client, scores)
+    
+    player_ids = sorted({score.player_id for score in scores})
+    if player_ids:
+        cache.invalidate([LEADERBOARD] + [player_namespace(player_id) for player_id in player_ids])
+    
+    # One live update per player and game mode is enough to refresh every board they are on
+    latest = {(score.player_id, score.game_mode): score for score in scores}
+    for score in latest.values():
+        publish_score_event(redis_client, score)
+
+def idempotent(scope: str, key: Optional[str], payload, handler):
+    """Run ``handler(claim)`` once per ``Idempotency-Key`` and replay its response to retries.
 
-def invalidate_cache_pattern(pattern: str):
-    """Invalidate cache keys matching pattern"""
+    Failed requests release the key so a retry runs again, except a 504 from
+    the queued writer: that score may still be written, and ``enqueue_score``
+    settles the claim once it knows.
+    """
+    if key is None:
+        return handler(None)
+    if not 0 < len(key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+    claim = f"{scope}:{key}"
+    request_fingerprint = fingerprint(payload)
+    record = idempotency.begin(claim, request_fingerprint)
+    if record is not None:
+        if record["fingerprint"] != request_fingerprint:
+            IDEMPOTENCY_REQUESTS.inc(scope=scope, result="mismatch")
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record["state"] == "pending":
+            IDEMPOTENCY_REQUESTS.inc(scope=scope, result="in_progress")
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                                headers={"Retry-After": "1"})
+        IDEMPOTENCY_REQUESTS.inc(scope=scope, result="replayed")
+        return JSONResponse(status_code=record["status"], content=record["body"],
+                            headers={"Idempotent-Replayed": "true"})
+    
+    IDEMPOTENCY_REQUESTS.inc(scope=scope, result="new")
     try:
-        keys = redis_client.keys(pattern)
-        if keys:
-            redis_client.delete(*keys)
-    except Exception as e:
-        print(f"Redis invalidate error: {e}")
+        response = handler((claim, request_fingerprint))
+    except HTTPException as e:
+        if e.status_code != 504:
+            idempotency.release(claim)
+        raise
+    except Exception:
+        idempotency.release(claim)
+        raise
+    if isinstance(response, JSONResponse):
+        idempotency.complete(claim, request_fingerprint, response.status_code, json.loads(response.body))
+    else:
+        idempotency.complete(claim, request_fingerprint, 200, jsonable_encoder(response))
+    return response
 
-async def trigger_achievement_check(player_id: int):
-    """Trigger achievement check in background"""
+def enqueue_score(new_score: Score, ack: str, claim=None):
     try:
-        async with httpx.AsyncClient() as client:
-            await client.post(f"http://localhost:8004/api/achievements/check/{player_id}")
+        future = writer.submit(new_score)
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Score queue is full", headers={"Retry-After": "1"})
+    if ack == "fast":
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
+            "player_id": new_score.player_id,
+            "game_mode": new_score.game_mode,
+            "score": new_score.score
+        })
+    try:
+        return ScoreResponse.from_orm(future.result(timeout=INGEST_ACK_TIMEOUT))
+    except concurrent.futures.TimeoutError:
+        if claim is not None:
+            future.add_done_callback(lambda done: settle_claim(claim, done))
+        raise HTTPException(status_code=504, detail="Score queued but not yet written")
     except Exception as e:
-        print(f"Failed to trigger achievement check: {e}")
+        raise HTTPException(status_code=500, detail=f"Score could not be written: {e}")
+
+def settle_claim(claim, future: concurrent.futures.Future):
+    """Record the outcome of a durable submission that outlived its acknowledgement"""
+    key, request_fingerprint = claim
+    if future.exception() is not None:
+        idempotency.release(key)
+    else:
+        idempotency.complete(key, request_fingerprint, 200, jsonable_encoder(ScoreResponse.from_orm(future.result())))
 
 @app.post("/api/scores", response_model=ScoreResponse)
-def submit_score(score_data: ScoreCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def submit_score(score_data: ScoreCreate,
+                 ack: str = Query("durable", pattern="^(durable|fast)$"),
+                 idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                 db: Session = Depends(get_db)):
+    # Retries with a known key are answered before touching the database
+    return idempotent("score", idempotency_key, score_data.dict(),
+                      lambda claim: create_score(score_data, ack, db, claim))
+
+def create_score(score_data: ScoreCreate, ack: str, db: Session, claim=None):
     # Check if player exists
-    player = db.query(Player).filter(Player.id == score_data.player_id).first()
+    player = db.query(Player.id).filter(Player.id == score_data.player_id).first()
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
     
@@ -82,82 +193,132 @@ def submit_score(score_data: ScoreCreate, background_tasks: BackgroundTasks, db:
         created_at=datetime.utcnow()
     )
     
+    # Queued mode: the writer commits it with others; ack=fast returns before that
+    if writer is not None:
+        # Hand the connection back first, or waiting requests can starve the writer of one
+        db.close()
+        return enqueue_score(new_score, ack, claim)
+    
     db.add(new_score)
+    db.flush()
+    record_scores(db, [new_score])
+    # The achievement service picks this up from the outbox
+    add_score_events(db, [new_score])
     db.commit()
     db.refresh(new_score)
     
-    # Invalidate related caches
-    invalidate_cache_pattern(f"scores:player:{score_data.player_id}*")
-    invalidate_cache_pattern(f"leaderboard:*")
-    invalidate_cache_pattern(f"player:stats:{score_data.player_id}")
+    # Invalidate related caches and push the new score to live leaderboard subscribers
+    scores_written([new_score])
+    
+    return ScoreResponse.from_orm(new_score)
+
+@app.post("/api/scores/batch", response_model=ScoreBatchResponse)
+def submit_scores(batch: ScoreBatchCreate,
+                  idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                  db: Session = Depends(get_db)):
+    """Submit many scores in one transaction; unknown players are reported per item"""
+    if len(batch.scores) > SCORE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {SCORE_BATCH_MAX} scores per batch")
+    return idempotent("score-batch", idempotency_key, batch.dict(), lambda claim: create_scores(batch, db))
+
+def create_scores(batch: ScoreBatchCreate, db: Session):
+    # Validate every player id up front
+    requested_ids = list({item.player_id for item in batch.scores})
+    known_ids = set()
+    for start in range(0, len(requested_ids), ID_LOOKUP_CHUNK):
+        chunk = requested_ids[start:start + ID_LOOKUP_CHUNK]
+        known_ids.update(row.id for row in db.query(Player.id).filter(Player.id.in_(chunk)))
+    
+    now = datetime.utcnow()
+    results = []
+    accepted = []
+    for index, item in enumerate(batch.scores):
+        if item.player_id not in known_ids:
+            results.append(ScoreBatchItem(index=index, status="rejected", error="Player not found"))
+            continue
+        accepted.append((index, Score(player_id=item.player_id, game_mode=item.game_mode, score=item.score, created_at=now)))
+        results.append(None)
     
-    # Trigger achievement check in background
-    background_tasks.add_task(trigger_achievement_check, score_data.player_id)
+    if accepted:
+        insert_scores(db, [new_score for _, new_score in accepted])
+        db.commit()
+    for index, new_score in accepted:
+        results[index] = ScoreBatchItem(index=index, status="created", id=new_score.id)
     
-    return new_score
+    scores_written([new_score for _, new_score in accepted])
+    
+    return ScoreBatchResponse(
+        created=len(accepted),
+        rejected=len(batch.scores) - len(accepted),
+        results=results
+    )
 
 @app.get("/api/scores", response_model=List[ScoreResponse])
-def get_all_scores(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    cache_key = f"scores:all:{skip}:{limit}"
-    cached = get_cached_data(cache_key)
+async def get_all_scores(request: Request, response: Response, cursor: Optional[str] = None,
+                         skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                         db: AsyncSession = Depends(get_async_db)):
+    # Only the first page is cached; later pages are cheap keyset seeks
+    first_page = not cursor and not skip
+    cache_key = f"scores:all:{limit}"
+    cached = await async_cache.get(cache_key) if first_page else None
     
     if cached:
-        return [ScoreResponse(**item) for item in cached]
-    
-    scores = db.query(Score).order_by(desc(Score.score)).offset(skip).limit(limit).all()
-    result = [ScoreResponse.from_orm(score) for score in scores]
-    
-    # Cache for 2 minutes
-    set_cached_data(cache_key, [score.dict() for score in result], 120)
+        result = [ScoreResponse(**item) for item in cached]
+    else:
+        scores = (await db.scalars(keyset_page(select(Score), cursor, skip, limit))).all()
+        result = [ScoreResponse.from_orm(score) for score in scores]
+        
+        # Cache for 2 minutes
+        if first_page:
+            await async_cache.set(cache_key, [score.dict() for score in result], 120)
     
+    set_page_headers(response, request, result, limit, skip)
     return result
 
 @app.get("/api/scores/player/{player_id}", response_model=List[ScoreResponse])
-def get_player_scores(player_id: int, skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
-    cache_key = f"scores:player:{player_id}:{skip}:{limit}"
-    cached = get_cached_data(cache_key)
+async def get_player_scores(player_id: int, request: Request, response: Response, cursor: Optional[str] = None,
+                            skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+                            db: AsyncSession = Depends(get_async_db)):
+    first_page = not cursor and not skip
+    cache_key = f"scores:player:{player_id}:{limit}"
+    cached = await async_cache.get(cache_key, [player_namespace(player_id)]) if first_page else None
     
     if cached:
-        return [ScoreResponse(**item) for item in cached]
-    
-    scores = db.query(Score).filter(
-        Score.player_id == player_id
-    ).order_by(desc(Score.score)).offset(skip).limit(limit).all()
-    
-    result = [ScoreResponse.from_orm(score) for score in scores]
-    
-    # Cache for 5 minutes
-    set_cached_data(cache_key, [score.dict() for score in result], 300)
+        result = [ScoreResponse(**item) for item in cached]
+    else:
+        statement = keyset_page(select(Score).where(Score.player_id == player_id), cursor, skip, limit)
+        scores = (await db.scalars(statement)).all()
+        result = [ScoreResponse.from_orm(score) for score in scores]
+        
+        # Cache for 5 minutes
+        if first_page:
+            await async_cache.set(cache_key, [score.dict() for score in result], 300, [player_namespace(player_id)])
     
+    set_page_headers(response, request, result, limit, skip)
     return result
 
 @app.get("/api/scores/player/{player_id}/stats")
-def get_player_stats(player_id: int, db: Session = Depends(get_db)):
+async def get_player_stats(player_id: int, db: AsyncSession = Depends(get_async_db)):
     cache_key = f"scores:player:{player_id}:stats"
-    cached = get_cached_data(cache_key)
+    cached = await async_cache.get(cache_key, [player_namespace(player_id)])
     
     if cached:
         return cached
     
-    stats = db.query(
-        Score.game_mode,
-        func.max(Score.score).label('best_score'),
-        func.avg(Score.score).label('avg_score'),
-        func.count(Score.id).label('total_games')
-    ).filter(Score.player_id == player_id).group_by(Score.game_mode).all()
+    stats = (await db.scalars(select(PlayerModeStats).where(PlayerModeStats.player_id == player_id))).all()
     
     result = [
         {
             "game_mode": stat.game_mode,
             "best_score": stat.best_score,
-            "avg_score": round(float(stat.avg_score), 2),
+            "avg_score": round(stat.total_score / stat.total_games, 2),
             "total_games": stat.total_games
         }
         for stat in stats
     ]
     
     # Cache for 10 minutes
-    set_cached_data(cache_key, result, 600)
+    await async_cache.set(cache_key, result, 600, [player_namespace(player_id)])
     
     return result
 
@@ -172,7 +333,8 @@ def health():
     return {
         "status": "healthy",
         "service": "score-service",
-        "redis": redis_status
+        "redis": redis_status,
+        "ingest": writer.snapshot() if writer else {"mode": "direct"}
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from sqlalchemy import insert
+
+from shared.database import SessionLocal
+from shared.metrics import Counter, Histogram
+from shared.models import Score
+from shared.outbox import add_score_events
+from shared.stats import record_scores
+
+# "direct" commits every submission itself, "queued" hands it to the group-commit writer
+INGEST_MODE = os.getenv("SCORE_INGEST_MODE", "direct")
+INGEST_QUEUE_SIZE = int(os.getenv("SCORE_INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("SCORE_INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_MS = float(os.getenv("SCORE_INGEST_FLUSH_MS", "10"))
+# How long a durable acknowledgement waits for its flush
+INGEST_ACK_TIMEOUT = float(os.getenv("SCORE_INGEST_ACK_TIMEOUT", "5"))
+
+INGEST_FLUSH_LATENCY = Histogram(
+    "score_ingest_flush_duration_seconds", "Time to write and commit one group of queued scores"
+)
+INGEST_BATCH_SIZE_HISTOGRAM = Histogram(
+    "score_ingest_batch_size", "Scores written per group commit",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+INGEST_SCORES = Counter(
+    "score_ingest_scores_total", "Queued score submissions by outcome (written, failed, rejected)", ["result"]
+)
+
+def insert_scores(db, scores: List[Score]) -> List[Score]:
+    """Insert ``scores`` with one multi-row statement and fill in their ids.
+
+    Uses a Core insert because the ORM falls back to one INSERT per row on
+    SQLite to keep RETURNING ordered. The player statistics and the outbox
+    events are written in the same transaction; the caller commits.
+    """
+    if not scores:
+        return scores
+    inserted = db.execute(
+        insert(Score).returning(Score.id, Score.player_id, Score.game_mode, Score.score),
+        [
+            {"player_id": s.player_id, "game_mode": s.game_mode, "score": s.score, "created_at": s.created_at}
+            for s in scores
+        ]
+    ).all()
+    # SQLite does not promise RETURNING order; identical rows are interchangeable
+    ids = defaultdict(deque)
+    for row in inserted:
+        ids[(row.player_id, row.game_mode, row.score)].append(row.id)
+    for new_score in scores:
+        new_score.id = ids[(new_score.player_id, new_score.game_mode, new_score.score)].popleft()
+    record_scores(db, scores)
+    add_score_events(db, scores)
+    return scores
+
+class ScoreWriter:
+    """Write-behind queue that commits scores in groups.
+
+    Submissions wait in a bounded queue; a single writer thread takes up to
+    ``batch_size`` of them, or whatever arrived within ``flush_ms`` of the
+    first, and writes them in one transaction. Each submission gets a
+    :class:`Future` that resolves once its group is committed.
+    """
+
+    def __init__(self, on_flushed: Callable[[List[Score]], None] = None, max_queue: int = INGEST_QUEUE_SIZE,
+                 batch_size: int = INGEST_BATCH_SIZE, flush_ms: float = INGEST_FLUSH_MS):
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.on_flushed = on_flushed
+        self.batch_size = batch_size
+        self.flush_seconds = flush_ms / 1000
+        self.thread: Optional[threading.Thread] = None
+        self.flushes = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="score-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Write everything already queued, then stop the writer"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def submit(self, score: Score) -> Future:
+        """Queue a score; raises ``queue.Full`` when the writer is saturated"""
+        future = Future()
+        try:
+            self.queue.put_nowait((score, future))
+        except queue.Full:
+            INGEST_SCORES.inc(result="rejected")
+            raise
+        return future
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_seconds
+            stopping = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.flush(batch)
+            if stopping:
+                return
+
+    def flush(self, batch):
+        scores = [score for score, _ in batch]
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            insert_scores(db, scores)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Score ingest flush failed ({len(batch)} scores): {e}")
+            INGEST_SCORES.inc(len(batch), result="failed")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            db.close()
+        INGEST_FLUSH_LATENCY.observe(time.perf_counter() - started)
+        INGEST_BATCH_SIZE_HISTOGRAM.observe(len(batch))
+        INGEST_SCORES.inc(len(batch), result="written")
+        self.flushes += 1
+
+        for score, future in batch:
+            future.set_result(score)
+        if self.on_flushed:
+            try:
+                self.on_flushed(scores)
+            except Exception as e:
+                print(f"Score ingest post-flush error: {e}")
+
+    def snapshot(self):
+        return {"mode": "queued", "depth": self.depth(), "capacity": self.queue.maxsize, "flushes": self.flushes}
@@ -2,7 +2,7 @@
 
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class ScoreCreate(BaseModel):
     player_id: int
@@ -17,4 +17,18 @@ class ScoreResponse(BaseModel):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ScoreBatchCreate(BaseModel):
+    scores: List[ScoreCreate]
+
+class ScoreBatchItem(BaseModel):
+    index: int
+    status: str  # "created" or "rejected"
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class ScoreBatchResponse(BaseModel):
+    created: int
+    rejected: int
+    results: List[ScoreBatchItem]
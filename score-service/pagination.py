@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import base64
+import json
+from typing import List, Optional, Tuple
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+from sqlalchemy import and_, desc, or_
+
+from shared.models import Score
+from models import ScoreResponse
+
+# Largest page a client may request
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(value: int, score_id: int) -> str:
+    """Opaque cursor pointing just past the score ``(value, score_id)`` in listing order"""
+    raw = json.dumps([value, score_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, score_id = json.loads(raw)
+        if not isinstance(value, int) or not isinstance(score_id, int):
+            raise ValueError("cursor fields must be integers")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, score_id
+
+def keyset_page(statement, cursor: Optional[str], skip: int, limit: int):
+    """Order by (score desc, id desc) and seek past ``cursor``.
+
+    The id tie-break makes the order total, so rows inserted between two
+    requests can never shift a page boundary, and with the matching indexes
+    the database seeks straight to the cursor however deep it is. ``skip``
+    is only honoured without a cursor, for clients still on offset paging.
+    """
+    if cursor:
+        value, score_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            Score.score < value,
+            and_(Score.score == value, Score.id < score_id)
+        ))
+    statement = statement.order_by(desc(Score.score), desc(Score.id))
+    if skip and not cursor:
+        statement = statement.offset(skip)
+    return statement.limit(limit)
+
+def set_page_headers(response, request, page: List[ScoreResponse], limit: int, skip: int):
+    """Advertise the next page through ``X-Next-Cursor`` and a ``Link`` header"""
+    if skip:
+        # Offset paging still works, but clients should follow the cursor instead
+        response.headers["Deprecation"] = "true"
+    if len(page) < limit:
+        return
+    cursor = encode_cursor(page[-1].score, page[-1].id)
+    response.headers["X-Next-Cursor"] = cursor
+    query = urlencode({"cursor": cursor, "limit": limit})
+    response.headers["Link"] = f'<{request.url.path}?{query}>; rel="next"'
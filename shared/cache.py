@@ -0,0 +1,107 @@
+import json
+from typing import Any, Iterable, List, Optional, Sequence
+
+from shared.metrics import CACHE_REQUESTS
+
+# Namespaces shared by the services that read and invalidate them
+LEADERBOARD = "leaderboard"
+
+def player_namespace(player_id: int) -> str:
+    return f"player:{player_id}"
+
+GENERATION_PREFIX = "cache:gen:"
+
+def _generation_keys(namespaces: Sequence[str]) -> List[str]:
+    return [GENERATION_PREFIX + namespace for namespace in namespaces]
+
+def _versioned(key: str, namespaces: Sequence[str], generations: Sequence) -> str:
+    versions = ",".join(f"{namespace}={generation or 0}" for namespace, generation in zip(namespaces, generations))
+    return f"{key}@{versions}"
+
+class VersionedCache:
+    """JSON cache in Redis with O(1) invalidation of whole namespaces.
+
+    Every namespace has a generation counter (``cache:gen:<namespace>``) and
+    each cached key embeds the current generations of the namespaces it
+    depends on. Invalidating a namespace is a single ``INCR``: readers then
+    build different keys and never see the old entries, which simply expire
+    through their TTL. Redis errors are logged and treated as cache misses.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def _versioned_key(self, key: str, namespaces: Sequence[str]) -> str:
+        if not namespaces:
+            return key
+        return _versioned(key, namespaces, self.redis.mget(_generation_keys(namespaces)))
+
+    def get(self, key: str, namespaces: Sequence[str] = ()) -> Optional[Any]:
+        try:
+            cached = self.redis.get(self._versioned_key(key, namespaces))
+            if cached:
+                CACHE_REQUESTS.inc(operation="get", result="hit")
+                return json.loads(cached)
+            CACHE_REQUESTS.inc(operation="get", result="miss")
+        except Exception as e:
+            CACHE_REQUESTS.inc(operation="get", result="error")
+            print(f"Redis get error: {e}")
+        return None
+
+    def set(self, key: str, data: Any, expiry: int = 300, namespaces: Sequence[str] = ()):
+        try:
+            self.redis.setex(self._versioned_key(key, namespaces), expiry, json.dumps(data, default=str))
+            CACHE_REQUESTS.inc(operation="set", result="stored")
+        except Exception as e:
+            CACHE_REQUESTS.inc(operation="set", result="error")
+            print(f"Redis set error: {e}")
+
+    def invalidate(self, namespaces: Iterable[str]):
+        """Bump the generation of every namespace in one round trip"""
+        namespaces: List[str] = list(namespaces)
+        if not namespaces:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for namespace in namespaces:
+                pipeline.incr(GENERATION_PREFIX + namespace)
+            pipeline.execute()
+            CACHE_REQUESTS.inc(len(namespaces), operation="invalidate", result="ok")
+        except Exception as e:
+            CACHE_REQUESTS.inc(operation="invalidate", result="error")
+            print(f"Redis invalidate error: {e}")
+
+class AsyncVersionedCache:
+    """:class:`VersionedCache` over a ``redis.asyncio`` client, for async endpoints.
+
+    Entries and generations are shared with the synchronous cache, so either
+    side sees the other's writes and invalidations.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    async def _versioned_key(self, key: str, namespaces: Sequence[str]) -> str:
+        if not namespaces:
+            return key
+        return _versioned(key, namespaces, await self.redis.mget(_generation_keys(namespaces)))
+
+    async def get(self, key: str, namespaces: Sequence[str] = ()) -> Optional[Any]:
+        try:
+            cached = await self.redis.get(await self._versioned_key(key, namespaces))
+            if cached:
+                CACHE_REQUESTS.inc(operation="get", result="hit")
+                return json.loads(cached)
+            CACHE_REQUESTS.inc(operation="get", result="miss")
+        except Exception as e:
+            CACHE_REQUESTS.inc(operation="get", result="error")
+            print(f"Redis get error: {e}")
+        return None
+
+    async def set(self, key: str, data: Any, expiry: int = 300, namespaces: Sequence[str] = ()):
+        try:
+            await self.redis.setex(await self._versioned_key(key, namespaces), expiry, json.dumps(data, default=str))
+            CACHE_REQUESTS.inc(operation="set", result="stored")
+        except Exception as e:
+            CACHE_REQUESTS.inc(operation="set", result="error")
+            print(f"Redis set error: {e}")
@@ -3,13 +3,44 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from shared.metrics import instrument_engine
+
 # Use absolute path to ensure all services use same database
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATABASE_URL = f"sqlite:///{project_root}/leaderboard.db"
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Ids per IN (...) lookup, below SQLite's limit on bound parameters per statement
+ID_LOOKUP_CHUNK = 500
+
+# Same database through an asyncio driver, for endpoints that await their queries
+# instead of holding a threadpool worker
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+
+# Created on first use, so services without async endpoints do not need the async driver
+async_engine = None
+AsyncSessionLocal = None
+
+def get_async_engine():
+    global async_engine, AsyncSessionLocal
+    if async_engine is None:
+        from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        # aiosqlite defaults to opening a connection (and its thread) per checkout; keep a pool
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, pool_size=ASYNC_POOL_SIZE)
+        instrument_engine(async_engine.sync_engine)
+        AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    return async_engine
+
+async def dispose_async_engine():
+    """Close pooled async connections; aiosqlite's worker threads otherwise keep the process alive"""
+    if async_engine is not None:
+        await async_engine.dispose()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -17,6 +48,14 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def create_tables():
     from shared.models import Base
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from shared.migrations import migrate
+    Base.metadata.create_all(bind=engine)
+    # Changes to existing tables, such as new indexes
+    migrate(engine)
\ No newline at end of file
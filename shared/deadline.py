@@ -0,0 +1,66 @@
+import asyncio
+import json
+from typing import Optional
+
+from shared.metrics import Counter
+
+# Remaining time budget travels between hops in this header (milliseconds)
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+DEADLINE_EXCEEDED = Counter(
+    "http_deadline_exceeded_total", "Requests abandoned because the caller's deadline passed", ["method"]
+)
+
+def request_budget(headers) -> Optional[float]:
+    """Seconds the caller is still waiting, from ``X-Request-Timeout-Ms``; ``None`` without one"""
+    value = headers.get(DEADLINE_HEADER)
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value) / 1000)
+    except ValueError:
+        return None
+
+class DeadlineMiddleware:
+    """Stops working on a request once the caller that sent it has given up.
+
+    Requests carrying ``X-Request-Timeout-Ms`` (the gateway forwards what is
+    left of its own deadline) are cancelled when the budget runs out and
+    answered ``504``, or just closed if the response had already started.
+    Blocking handlers running in the threadpool finish in the background,
+    but their response is dropped. Requests without the header are untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        budget = request_budget(headers)
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = {"response": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                started["response"] = True
+            await send(message)
+
+        try:
+            await asyncio.wait_for(self.app(scope, receive, send_wrapper), timeout=budget)
+        except asyncio.TimeoutError:
+            DEADLINE_EXCEEDED.inc(method=scope["method"])
+            if started["response"]:
+                return
+            body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            })
+            await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,20 @@
+import json
+
+# Redis pub/sub channel carrying one message per submitted score
+SCORE_EVENTS_CHANNEL = "events:scores"
+
+def score_event(score) -> dict:
+    return {
+        "id": score.id,
+        "player_id": score.player_id,
+        "game_mode": score.game_mode,
+        "score": score.score,
+        "created_at": score.created_at.isoformat() if score.created_at else None,
+    }
+
+def publish_score_event(redis_client, score):
+    """Announce a new score to live subscribers; best effort, never raises"""
+    try:
+        redis_client.publish(SCORE_EVENTS_CHANNEL, json.dumps(score_event(score)))
+    except Exception as e:
+        print(f"Redis publish error: {e}")
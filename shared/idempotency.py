@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from shared.metrics import Counter
+
+# How long a completed response is replayed for a repeated key
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+# How long a key stays claimed by a request that has not finished (or crashed)
+IDEMPOTENCY_PENDING_TTL = int(os.getenv("IDEMPOTENCY_PENDING_TTL", "60"))
+# Keys kept in process memory while Redis is unavailable
+IDEMPOTENCY_LOCAL_MAX = int(os.getenv("IDEMPOTENCY_LOCAL_MAX", "10000"))
+
+IDEMPOTENCY_REQUESTS = Counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key by outcome", ["scope", "result"]
+)
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request payload, to spot a key reused for a different request"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+class LocalTTLStore:
+    """Bounded in-process stand-in for the few Redis commands the store uses"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_LOCAL_MAX):
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            return None
+        return value
+
+    def set(self, key: str, value: str, ex: int, nx: bool = False) -> bool:
+        with self.lock:
+            if nx and self._live(key) is not None:
+                return False
+            self.entries[key] = (time.monotonic() + ex, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            return self._live(key)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class IdempotencyStore:
+    """Remembers the response to each ``Idempotency-Key`` for a bounded time.
+
+    ``begin`` claims a key with ``SET NX`` and returns ``None`` to the first
+    request; later requests with the key get its record instead, either
+    ``{"state": "pending"}`` while the first is still running, or the stored
+    status and body once it has completed. ``release`` frees the key of a
+    request that failed, so a retry runs afresh. Records live in Redis so
+    every instance sees them; while Redis is unreachable a per-process
+    store keeps deduplicating retries that reach the same instance.
+    """
+
+    def __init__(self, redis_client, prefix: str = "idempotency:"):
+        self.redis = redis_client
+        self.local = LocalTTLStore()
+        self.prefix = prefix
+
+    def _call(self, command: str, *args, **kwargs):
+        try:
+            return getattr(self.redis, command)(*args, **kwargs)
+        except Exception as e:
+            print(f"Idempotency store falling back to memory: {e}")
+            return getattr(self.local, command)(*args, **kwargs)
+
+    def begin(self, key: str, request_fingerprint: str) -> Optional[dict]:
+        key = self.prefix + key
+        pending = json.dumps({"state": "pending", "fingerprint": request_fingerprint})
+        if self._call("set", key, pending, ex=IDEMPOTENCY_PENDING_TTL, nx=True):
+            return None
+        record = self._call("get", key)
+        if record is None:
+            # Expired between the two calls; the client's next retry claims it
+            return {"state": "pending", "fingerprint": request_fingerprint}
+        return json.loads(record)
+
+    def complete(self, key: str, request_fingerprint: str, status: int, body: Any):
+        record = json.dumps({"state": "done", "fingerprint": request_fingerprint, "status": status, "body": body},
+                            default=str)
+        self._call("set", self.prefix + key, record, ex=IDEMPOTENCY_TTL)
+
+    def release(self, key: str):
+        self._call("delete", self.prefix + key)
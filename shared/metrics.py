@@ -0,0 +1,223 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Samples = Iterable[Tuple[Dict[str, str], float]]
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Samples]] = None, registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect_fn = collect
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        if self.collect_fn is not None:
+            return [(self.name, dict(labels), value) for labels, value in self.collect_fn()]
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: "Registry" = None):
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self.series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(series)) for key, series in self.series.items()]
+        result = []
+        for key, series in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                result.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            result.append((f"{self.name}_sum", labels, series[-2]))
+            result.append((f"{self.name}_count", labels, series[-1]))
+        return result
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.const_labels: Dict[str, str] = {}
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                labels = {**self.const_labels, **labels}
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Shared instrumentation used by every service
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request", ["method", "route"]
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled", ["method"]
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Redis cache operations by result (hit, miss, stored, error)", ["operation", "result"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Time spent executing SQL statements", ["statement"], buckets=DB_BUCKETS
+)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware so streamed responses are timed to the last byte"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Use the route template, not the raw path, to keep label cardinality bounded;
+            # handlers serving many paths can name their own via scope["metrics_route"]
+            route = scope.get("metrics_route") or getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_IN_PROGRESS.dec(method=method)
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status["code"])
+
+def instrument_app(app, service: str):
+    """Add request metrics and a ``/metrics`` endpoint to a FastAPI app"""
+    from fastapi import Response
+
+    REGISTRY.const_labels["service"] = service
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def instrument_engine(engine):
+    """Record the duration of every SQL statement run on ``engine``"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_LATENCY.observe(time.perf_counter() - started, statement=verb)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
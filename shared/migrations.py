@@ -0,0 +1,96 @@
+"""Versioned schema migrations.
+
+``create_all`` only creates missing tables, so anything that changes a table
+that already exists (indexes above all) is a migration here. Each migration
+has a version number and runs once per database; applied versions are
+recorded in ``schema_version``. Services run pending migrations on startup
+through ``create_tables()``; to run or inspect them by hand::
+
+    python -m shared.migrations upgrade
+    python -m shared.migrations status
+
+SQLite commits DDL as it goes, so a migration that fails halfway is retried
+from the start on the next run: write migrations that can be re-applied
+(``CREATE INDEX IF NOT EXISTS`` and the like). Indexes added here are also
+declared on the models so fresh databases get them from ``create_all``.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+metadata = MetaData()
+
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+def create_indexes(*indexes: Tuple[str, str, str]) -> Callable:
+    """Migration creating ``(name, table, columns)`` indexes; the names are kept on ``.indexes``"""
+    def apply(conn):
+        for name, table, columns in indexes:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    apply.indexes = [name for name, _, _ in indexes]
+    return apply
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "score listing keyset indexes", create_indexes(
+        # GET /api/scores and /api/scores/player/{id} seek on (score, id)
+        ("ix_scores_score_id", "scores", "score, id"),
+        ("ix_scores_player_score_id", "scores", "player_id, score, id"),
+    )),
+    (2, "leaderboard, activity and achievement indexes", create_indexes(
+        # Global top-N walks best_score in order; ranks count the players above
+        ("ix_players_best_score", "players", "best_score, total_games"),
+        # Recent activity feed
+        ("ix_scores_created_at", "scores", "created_at"),
+        # Player achievements, achievement checks and the achievement leaderboard join
+        ("ix_player_achievements_player", "player_achievements", "player_id, achievement_id"),
+    )),
+]
+
+def current_version(conn) -> int:
+    return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+def migrate(engine) -> List[int]:
+    """Apply pending migrations in order; returns the versions applied"""
+    metadata.create_all(bind=engine)
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        with engine.begin() as conn:
+            if version <= current_version(conn):
+                continue
+            apply(conn)
+            # Services start together; whichever finishes second records nothing
+            conn.execute(
+                sqlite_insert(schema_version)
+                .values(version=version, name=name, applied_at=datetime.utcnow())
+                .on_conflict_do_nothing()
+            )
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+if __name__ == "__main__":
+    import argparse
+    from shared.database import create_tables, engine
+
+    parser = argparse.ArgumentParser(description="Apply or inspect schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        create_tables()
+    metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        version = current_version(conn)
+    for number, name, _ in MIGRATIONS:
+        print(f"{'applied' if number <= version else 'pending'}  {number:3d}  {name}")
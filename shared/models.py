@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -24,6 +24,11 @@ class Player(Base):
     
     scores = relationship("Score", back_populates="player")
     achievements = relationship("PlayerAchievement", back_populates="player")
+    
+    __table_args__ = (
+        # Global leaderboard order and rank counts
+        Index("ix_players_best_score", "best_score", "total_games"),
+    )
 
 class Score(Base):
     __tablename__ = "scores"
@@ -35,6 +40,51 @@ class Score(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     player = relationship("Player", back_populates="scores")
+    
+    __table_args__ = (
+        # Keyset pagination of score listings, overall and per player
+        Index("ix_scores_score_id", "score", "id"),
+        Index("ix_scores_player_score_id", "player_id", "score", "id"),
+        # Recent activity feed
+        Index("ix_scores_created_at", "created_at"),
+    )
+
+class PlayerModeStats(Base):
+    """Running aggregates per player and game mode, kept in step with ``scores``"""
+    __tablename__ = "player_mode_stats"
+    
+    player_id = Column(Integer, ForeignKey("players.id"), primary_key=True)
+    game_mode = Column(String(50), primary_key=True)
+    total_games = Column(Integer, nullable=False, default=0)
+    total_score = Column(Integer, nullable=False, default=0)
+    best_score = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Per-mode leaderboards and ranks
+        Index("ix_player_mode_stats_mode_best", "game_mode", "best_score"),
+    )
+
+class OutboxEvent(Base):
+    """Event written in the same transaction as the change it describes"""
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    player_id = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Never reuse ids once processed rows are deleted: consumers track their position by id
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class OutboxCheckpoint(Base):
+    """Last outbox event id each consumer has fully processed"""
+    __tablename__ = "outbox_checkpoints"
+    
+    consumer = Column(String(50), primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 class Achievement(Base):
     __tablename__ = "achievements"
@@ -62,4 +112,8 @@ class PlayerAchievement(Base):
     progress = Column(Integer, default=0)  # For progressive achievements
     
     player = relationship("Player", back_populates="achievements")
-    achievement = relationship("Achievement", back_populates="players")
\ No newline at end of file
+    achievement = relationship("Achievement", back_populates="players")
+    
+    __table_args__ = (
+        Index("ix_player_achievements_player", "player_id", "achievement_id"),
+    )
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Transactional outbox between the score and achievement services.
+
+Writers add an event row in the same transaction as the scores it describes,
+so an event exists exactly when its score does. Consumers read the table in
+id order and keep their position in ``outbox_checkpoints``. Delivery is
+at-least-once: a batch whose handler fails is read again on the next poll.
+Handler writes commit together with the checkpoint, so a batch never takes
+effect twice.
+
+Ids are taken in commit order because SQLite serialises writers; a database
+with concurrent writers would need a commit-ordered sequence instead.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from shared.database import SessionLocal
+from shared.metrics import Counter, Gauge
+from shared.models import OutboxCheckpoint, OutboxEvent, Score
+
+SCORE_SUBMITTED = "score_submitted"
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Idle wait between polls; a full batch is followed by the next one straight away
+OUTBOX_POLL_MS = float(os.getenv("OUTBOX_POLL_MS", "200"))
+
+OUTBOX_EVENTS = Counter(
+    "outbox_events_total", "Outbox events handled by consumers (processed, failed)", ["consumer", "result"]
+)
+OUTBOX_LAG = Gauge("outbox_consumer_lag", "Outbox events written but not yet processed", ["consumer"])
+
+def add_score_events(db, scores: Iterable[Score]):
+    """Record a ``score_submitted`` event per score; call inside the inserting transaction"""
+    now = datetime.utcnow()
+    rows = [
+        {
+            "event_type": SCORE_SUBMITTED,
+            "player_id": score.player_id,
+            "payload": json.dumps({
+                "score_id": score.id,
+                "player_id": score.player_id,
+                "game_mode": score.game_mode,
+                "score": score.score
+            }),
+            "created_at": now
+        }
+        for score in scores
+    ]
+    if rows:
+        db.connection().execute(insert(OutboxEvent), rows)
+
+class OutboxConsumer:
+    """Drains the outbox in batches on a background thread.
+
+    ``handler(db, events)`` applies a batch without committing; the consumer
+    then moves its checkpoint past the batch and commits both together. The
+    checkpoint only moves if it still holds the value the batch was read
+    after, so when several replicas poll the same consumer name only one of
+    them commits each batch.
+    """
+
+    def __init__(self, name: str, handler: Callable, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_ms: float = OUTBOX_POLL_MS):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_seconds = poll_ms / 1000
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.position = 0
+        self.head = 0
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            db.execute(
+                sqlite_insert(OutboxCheckpoint)
+                .values(consumer=self.name, last_event_id=0, updated_at=datetime.utcnow())
+                .on_conflict_do_nothing()
+            )
+            db.commit()
+        finally:
+            db.close()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name=f"outbox-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                handled = self.poll()
+            except Exception as e:
+                print(f"Outbox consumer {self.name} error: {e}")
+                handled = 0
+            if handled < self.batch_size:
+                self.stopping.wait(self.poll_seconds)
+
+    def poll(self) -> int:
+        """Process at most one batch; returns the number of events handled"""
+        db = SessionLocal()
+        try:
+            position = db.query(OutboxCheckpoint.last_event_id).filter(
+                OutboxCheckpoint.consumer == self.name
+            ).scalar() or 0
+            self.position = position
+            self.head = db.query(func.max(OutboxEvent.id)).scalar() or position
+            OUTBOX_LAG.set(self.lag(), consumer=self.name)
+            events: List[OutboxEvent] = db.query(OutboxEvent).filter(
+                OutboxEvent.id > position
+            ).order_by(OutboxEvent.id).limit(self.batch_size).all()
+            if not events:
+                return 0
+
+            try:
+                self.handler(db, events)
+                advanced = db.execute(
+                    update(OutboxCheckpoint)
+                    .where(OutboxCheckpoint.consumer == self.name, OutboxCheckpoint.last_event_id == position)
+                    .values(last_event_id=events[-1].id, updated_at=datetime.utcnow())
+                ).rowcount
+                if not advanced:
+                    # Another replica committed this batch first
+                    db.rollback()
+                    return 0
+                db.commit()
+            except Exception:
+                db.rollback()
+                OUTBOX_EVENTS.inc(len(events), consumer=self.name, result="failed")
+                raise
+            OUTBOX_EVENTS.inc(len(events), consumer=self.name, result="processed")
+            self.position = events[-1].id
+            OUTBOX_LAG.set(self.lag(), consumer=self.name)
+            self.prune(db)
+            return len(events)
+        finally:
+            db.close()
+
+    def prune(self, db):
+        """Delete events every consumer has processed"""
+        processed = db.query(func.min(OutboxCheckpoint.last_event_id)).scalar()
+        if processed:
+            db.query(OutboxEvent).filter(OutboxEvent.id <= processed).delete(synchronize_session=False)
+            db.commit()
+
+    def lag(self) -> int:
+        return max(self.head - self.position, 0)
+
+    def snapshot(self):
+        return {"consumer": self.name, "position": self.position, "lag": self.lag()}
+
+def score_events(events: Iterable[OutboxEvent]) -> List[dict]:
+    return [json.loads(event.payload) for event in events if event.event_type == SCORE_SUBMITTED]
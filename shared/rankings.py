@@ -0,0 +1,158 @@
+"""Best scores in Redis sorted sets, for ``LEADERBOARD_ENGINE=redis``.
+
+``ranking:all`` holds every player's best score across modes and
+``ranking:mode:<game_mode>`` the best per game mode, with player ids as
+members. The score service raises them with ``ZADD GT`` after each write, so
+every leaderboard replica reads the same ranking. Rebuild them from the
+player statistics tables (after enabling the engine, or if Redis lost
+data) with::
+
+    python -m shared.rankings rebuild
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+
+import redis
+
+from shared.database import ID_LOOKUP_CHUNK
+from shared.models import Player, PlayerModeStats
+
+# "memory", "sql" or "redis"; read by the leaderboard service, and by the score service for "redis"
+LEADERBOARD_ENGINE = os.getenv("LEADERBOARD_ENGINE", "memory")
+
+RANKING_ALL = "ranking:all"
+RANKING_MODES = "ranking:modes"
+# One rebuild at a time across every replica; the lock expires if its holder dies
+RANKING_REBUILD_LOCK = "ranking:rebuild:lock"
+RANKING_REBUILD_LOCK_MS = int(os.getenv("RANKING_REBUILD_LOCK_MS", "60000"))
+
+def ranking_key(game_mode: Optional[str]) -> str:
+    return f"ranking:mode:{game_mode}" if game_mode else RANKING_ALL
+
+def record_best_scores(redis_client, scores: Iterable):
+    """Raise the players' best scores; best effort, the rebuild repairs anything missed"""
+    best: Dict[str, Dict[str, int]] = {}
+    modes = set()
+    for score in scores:
+        modes.add(score.game_mode)
+        for key in (RANKING_ALL, ranking_key(score.game_mode)):
+            members = best.setdefault(key, {})
+            members[str(score.player_id)] = max(members.get(str(score.player_id), score.score), score.score)
+    if not best:
+        return
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for key, members in best.items():
+            pipeline.zadd(key, members, gt=True)
+        pipeline.sadd(RANKING_MODES, *modes)
+        pipeline.execute()
+    except Exception as e:
+        print(f"Redis ranking update error: {e}")
+
+def _ranked_ids(db, key: str, player_ids: List[int]) -> Set[int]:
+    """Which of ``player_ids`` the database currently ranks on the board stored at ``key``"""
+    found: Set[int] = set()
+    game_mode = key[len("ranking:mode:"):] if key != RANKING_ALL else None
+    for start in range(0, len(player_ids), ID_LOOKUP_CHUNK):
+        chunk = player_ids[start:start + ID_LOOKUP_CHUNK]
+        if game_mode:
+            query = db.query(PlayerModeStats.player_id).filter(
+                PlayerModeStats.game_mode == game_mode, PlayerModeStats.player_id.in_(chunk)
+            )
+        else:
+            query = db.query(Player.id).filter(Player.total_games > 0, Player.id.in_(chunk))
+        found.update(player_id for player_id, in query)
+    return found
+
+def _release(redis_client, token: str):
+    """Delete the rebuild lock only if this run still holds it"""
+    with redis_client.pipeline() as pipeline:
+        try:
+            pipeline.watch(RANKING_REBUILD_LOCK)
+            if pipeline.get(RANKING_REBUILD_LOCK) == token:
+                pipeline.multi()
+                pipeline.delete(RANKING_REBUILD_LOCK)
+                pipeline.execute()
+        except redis.WatchError:
+            pass
+
+def rebuild(redis_client, db) -> Optional[Dict[str, int]]:
+    """Merge the best scores in the database into the ranking sets; returns their sizes.
+
+    Returns ``None`` without doing anything while another process holds the
+    rebuild lock. Each set is merged with ``ZUNIONSTORE ... AGGREGATE MAX``
+    rather than replaced, so ``ZADD GT`` raises that land while the database
+    is read are kept; members the database no longer ranks (deleted
+    players) are then removed one by one.
+    """
+    token = uuid.uuid4().hex
+    if not redis_client.set(RANKING_REBUILD_LOCK, token, nx=True, px=RANKING_REBUILD_LOCK_MS):
+        return None
+    try:
+        sets: Dict[str, Dict[str, int]] = {RANKING_ALL: {}}
+        for player_id, best in db.query(Player.id, Player.best_score).filter(Player.total_games > 0):
+            sets[RANKING_ALL][str(player_id)] = best
+        modes = set()
+        for game_mode, player_id, best in db.query(
+            PlayerModeStats.game_mode, PlayerModeStats.player_id, PlayerModeStats.best_score
+        ):
+            modes.add(game_mode)
+            sets.setdefault(ranking_key(game_mode), {})[str(player_id)] = best
+        db.rollback()
+
+        # Staging keys are private to this run and expire if it dies part way
+        staging = {key: f"{key}:rebuild:{token}" for key, members in sets.items() if members}
+        pipeline = redis_client.pipeline(transaction=False)
+        for key, staged in staging.items():
+            items = list(sets[key].items())
+            for start in range(0, len(items), 10000):
+                pipeline.zadd(staged, dict(items[start:start + 10000]))
+            pipeline.pexpire(staged, RANKING_REBUILD_LOCK_MS)
+        pipeline.execute()
+
+        merge = redis_client.pipeline(transaction=True)
+        for key, staged in staging.items():
+            merge.zunionstore(key, [staged, key], aggregate="MAX")
+            merge.delete(staged)
+        if modes:
+            merge.sadd(RANKING_MODES, *modes)
+        merge.execute()
+
+        # Members missing from the snapshot are new players or deleted ones; ask the database again
+        keys = set(sets) | {ranking_key(mode) for mode in redis_client.smembers(RANKING_MODES)}
+        for key in keys:
+            missing = [int(member) for member in redis_client.zrange(key, 0, -1) if member not in sets.get(key, {})]
+            if missing:
+                gone = set(missing) - _ranked_ids(db, key, missing)
+                if gone:
+                    redis_client.zrem(key, *map(str, gone))
+        empty = [mode for mode in redis_client.smembers(RANKING_MODES) if not redis_client.exists(ranking_key(mode))]
+        if empty:
+            redis_client.srem(RANKING_MODES, *empty)
+        return {key: redis_client.zcard(key) for key in keys if key == RANKING_ALL or redis_client.exists(key)}
+    finally:
+        _release(redis_client, token)
+
+if __name__ == "__main__":
+    import argparse
+    from shared.database import SessionLocal, create_tables
+    from shared.redis_clients import connect_redis
+
+    parser = argparse.ArgumentParser(description="Maintain the Redis leaderboard sorted sets")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        sizes = rebuild(connect_redis(), db)
+        if sizes is None:
+            print("Another rebuild is running")
+        for key, size in (sizes or {}).items():
+            print(f"{key}: {size} players")
+    finally:
+        db.close()
@@ -0,0 +1,13 @@
+import os
+
+import redis
+import redis.asyncio as aioredis
+
+# Every service and tool connects to the same Redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+def connect_redis() -> redis.Redis:
+    return redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+def connect_async_redis() -> aioredis.Redis:
+    return aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
@@ -0,0 +1,123 @@
+"""Incrementally maintained player statistics.
+
+``player_mode_stats`` holds count, sum and best score per (player, game mode)
+and the ``players`` table holds the same totals across all modes. Both are
+updated in the transaction that inserts the scores, so readers get them with
+a primary-key lookup instead of aggregating the score history.
+
+Rebuild both from ``scores`` (for backfills or after manual edits) with::
+
+    python -m shared.stats rebuild
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from shared.models import Player, PlayerModeStats, Score
+
+def record_scores(db, scores: Iterable[Score]):
+    """Fold new scores into the aggregates; call inside the inserting transaction"""
+    per_mode = defaultdict(lambda: [0, 0, 0])
+    per_player = defaultdict(lambda: [0, 0, 0])
+    for score in scores:
+        for totals in (per_mode[(score.player_id, score.game_mode)], per_player[score.player_id]):
+            totals[0] += 1
+            totals[1] += score.score
+            totals[2] = max(totals[2], score.score)
+    if not per_mode:
+        return
+
+    now = datetime.utcnow()
+    # Plain Core executemany: the ORM bulk paths can't express increments
+    stats = PlayerModeStats.__table__
+    statement = sqlite_insert(stats)
+    db.connection().execute(
+        statement.on_conflict_do_update(
+            index_elements=[stats.c.player_id, stats.c.game_mode],
+            set_={
+                "total_games": stats.c.total_games + statement.excluded.total_games,
+                "total_score": stats.c.total_score + statement.excluded.total_score,
+                "best_score": func.max(stats.c.best_score, statement.excluded.best_score),
+                "updated_at": statement.excluded.updated_at,
+            }
+        ),
+        [
+            {"player_id": player_id, "game_mode": game_mode, "total_games": games,
+             "total_score": total, "best_score": best, "updated_at": now}
+            for (player_id, game_mode), (games, total, best) in per_mode.items()
+        ]
+    )
+
+    players = Player.__table__
+    db.connection().execute(
+        update(players).where(players.c.id == bindparam("player")).values(
+            total_games=func.coalesce(players.c.total_games, 0) + bindparam("games"),
+            total_score=func.coalesce(players.c.total_score, 0) + bindparam("total"),
+            best_score=func.max(func.coalesce(players.c.best_score, 0), bindparam("best")),
+            last_active=now
+        ),
+        [
+            {"player": player_id, "games": games, "total": total, "best": best}
+            for player_id, (games, total, best) in per_player.items()
+        ]
+    )
+
+def rebuild(db) -> int:
+    """Recompute every aggregate from the score history; returns the number of stats rows"""
+    db.query(PlayerModeStats).delete()
+    rows = db.query(
+        Score.player_id,
+        Score.game_mode,
+        func.count(Score.id),
+        func.sum(Score.score),
+        func.max(Score.score)
+    ).group_by(Score.player_id, Score.game_mode).all()
+    now = datetime.utcnow()
+    db.add_all([
+        PlayerModeStats(player_id=player_id, game_mode=game_mode, total_games=games,
+                        total_score=total, best_score=best, updated_at=now)
+        for player_id, game_mode, games, total, best in rows
+    ])
+    db.flush()
+
+    def total(column):
+        return select(func.coalesce(column, 0)).where(
+            PlayerModeStats.player_id == Player.id
+        ).scalar_subquery()
+
+    db.execute(update(Player).values(
+        total_games=total(func.sum(PlayerModeStats.total_games)),
+        total_score=total(func.sum(PlayerModeStats.total_score)),
+        best_score=total(func.max(PlayerModeStats.best_score))
+    ))
+    db.commit()
+    return len(rows)
+
+def ensure_built(db):
+    """Backfill on first start against a database that predates the stats table"""
+    if db.query(PlayerModeStats.player_id).first() is None and db.query(Score.id).first() is not None:
+        count = rebuild(db)
+        print(f"Built player stats for {count} player/mode pairs")
+
+if __name__ == "__main__":
+    import argparse
+    from shared.database import SessionLocal, create_tables
+
+    parser = argparse.ArgumentParser(description="Maintain the player statistics tables")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    create_tables()
+    db = SessionLocal()
+    try:
+        count = rebuild(db)
+        print(f"Rebuilt player stats for {count} player/mode pairs")
+    finally:
+        db.close()